@@ -3,12 +3,60 @@ Email Thread Categorizer
 Uses AI and algorithms to categorize email threads
 """
 
+import bisect
+import hashlib
 import logging
-import re
-from typing import List, Dict
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from src.parsers.thread_builder import EmailThread
-from src.utils.api_client import ClaudeAPIClient
+from src.utils.api_client import CATEGORIZE_PROMPT_TAG, ClaudeAPIClient
+from src.utils.result_cache import ResultCache
+
+
+class _NonWordToSpace(dict):
+    """
+    str.translate table mapping every character except a-z, а-я and 0-9 to a space.
+    Entries are filled lazily, so each distinct character is classified only once.
+    """
+    
+    def __missing__(self, codepoint: int):
+        char = chr(codepoint)
+        is_word_char = 'a' <= char <= 'z' or 'а' <= char <= 'я' or '0' <= char <= '9'
+        value = codepoint if is_word_char else ' '
+        self[codepoint] = value
+        return value
+
+
+_TRANS = _NonWordToSpace()
+
+# bytes.translate table for ASCII-only text: lowercases A-Z, keeps a-z and 0-9, maps the rest to a space
+_ASCII_TRANS = bytes(
+    code + 32 if 65 <= code <= 90 else code if 97 <= code <= 122 or 48 <= code <= 57 else 32
+    for code in range(256)
+)
+
+_STOP_WORDS = frozenset({
+    'the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'as', 'to', 'for', 'of', 'in',
+    'что', 'это', 'как', 'для', 'или', 'при', 'без', 'после', 'письмо'
+})
+
+# Subtracting this counter drops every stop word regardless of its count
+_STOP_COUNTER = Counter(dict.fromkeys(_STOP_WORDS, 10 ** 9))
+
+# Noun and adjective case/number endings (and English plurals); category names
+# whose last words differ only by these after a shared stem are merged
+_INFLECTION_ENDINGS = frozenset({
+    '', 'а', 'я', 'о', 'е', 'ё', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    'ам', 'ям', 'ами', 'ями', 'ах', 'ях', 'ов', 'ев', 'ей', 'ой', 'ом', 'ем', 'ою', 'ею', 'ью',
+    'ия', 'ие', 'ий', 'ии', 'ию', 'ией', 'иям', 'иями', 'иях',
+    'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ого', 'его', 'ому', 'ему', 'ым', 'им', 'ую', 'юю',
+    'ых', 'их', 'ыми', 'ими',
+    's', 'es',
+})
 
 
 class ThreadCategory:
@@ -43,6 +91,13 @@ class ThreadCategory:
 class Categorizer:
     """Categorize email threads"""
     
+    # Threads sent to the API in one categorization request (overridable via categorization.batch_size)
+    BATCH_SIZE = 20
+    # Concurrent categorization requests (overridable via categorization.concurrency)
+    MAX_WORKERS = 8
+    # Minimum shared stem of the last word for a prefix merge ("инвойс|у" / "инвойс|ам")
+    MIN_MERGE_STEM = 4
+    
     def __init__(self, config: dict, api_client: ClaudeAPIClient):
         self.logger = logging.getLogger(__name__)
         self.config = config
@@ -51,13 +106,27 @@ class Categorizer:
         cat_config = config.get('categorization', {})
         self.max_categories = cat_config.get('clustering', {}).get('max_categories', 15)
         self.ai_enabled = cat_config.get('ai_labeling', {}).get('enabled', True)
+        self.max_workers = max(1, int(cat_config.get('concurrency', self.MAX_WORKERS)))
+        self.batch_size = max(1, int(cat_config.get('batch_size', self.BATCH_SIZE)))
+        
+        # Cache AI categories by subject + top keywords; persisted when a temp folder is configured.
+        # The model and prompts are part of every key, so changing either starts afresh
+        cache_config = cat_config.get('cache', {})
+        self.cache_ttl_seconds = float(cache_config.get('ttl_hours', 720)) * 3600
+        self.cache_namespace = f"{api_client.model_categorization}|{CATEGORIZE_PROMPT_TAG}"
+        cache_path = None
+        if cache_config.get('enabled', True) and 'temp' in config.get('paths', {}):
+            cache_path = Path(config['paths']['temp']) / '.reportmaster_cache.sqlite'
+        self.result_cache = ResultCache(cache_path, table='categories')
     
-    def categorize_threads(self, threads: List[EmailThread]) -> List[ThreadCategory]:
+    def categorize_threads(self, threads: List[EmailThread],
+                           progress_callback: Optional[Callable[[int, int], None]] = None) -> List[ThreadCategory]:
         """
         Categorize email threads
         
         Args:
             threads: List of EmailThread objects
+            progress_callback: Optional callable(done, total) called as threads get categorized
         
         Returns:
             List of ThreadCategory objects
@@ -69,34 +138,30 @@ class Categorizer:
         
         categories = []
         categories_by_name = {}
+        sorted_names = []
         category_counter = 1
         
-        for thread in threads:
-            # Extract keywords from thread
-            keywords = self._extract_keywords(thread)
-            
-            # Get sample content
-            sample_content = self._get_sample_content(thread)
-            
-            # Use AI to categorize if enabled
-            if self.ai_enabled and self.api_client.client:
-                result = self.api_client.categorize_thread(
-                    subject=thread.subject,
-                    keywords=keywords,
-                    sample_content=sample_content
-                )
-                
-                category_name = result['category']
-                category_desc = result['description']
-            else:
-                # Fallback: use subject as category
-                category_name = thread.subject[:50]
-                category_desc = f"Thread with {thread.message_count} messages"
+        if self.ai_enabled and self.api_client.client:
+            results = self._categorize_with_ai(threads, progress_callback)
+        else:
+            # Fallback: use subject as category
+            results = [
+                {
+                    'category': thread.subject[:50],
+                    'description': f"Thread with {thread.message_count} messages"
+                }
+                for thread in threads
+            ]
+        
+        for thread, result in zip(threads, results):
+            category_name = result['category']
+            category_desc = result['description']
             
             normalized_category_name = self._normalize_category_name(category_name)
+            similar_name = self._find_similar_name(normalized_category_name, sorted_names)
 
-            if normalized_category_name in categories_by_name:
-                category = categories_by_name[normalized_category_name]
+            if similar_name is not None:
+                category = categories_by_name[similar_name]
                 category.add_thread(thread)
             else:
                 category = ThreadCategory(
@@ -107,6 +172,7 @@ class Categorizer:
                 category.add_thread(thread)
                 categories.append(category)
                 categories_by_name[normalized_category_name] = category
+                bisect.insort(sorted_names, normalized_category_name)
                 category_counter += 1
             
             self.logger.info(f"  Thread '{thread.subject[:40]}...' -> Category: {category_name}")
@@ -115,23 +181,84 @@ class Categorizer:
         
         return categories
     
+    def _categorize_with_ai(self, threads: List[EmailThread],
+                            progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Dict]:
+        """Categorize threads with batched, concurrent API requests (results keep thread order)"""
+        keywords_list = [self._extract_keywords(thread) for thread in threads]
+        cache_keys = [self._cache_key(t.subject, k) for t, k in zip(threads, keywords_list)]
+        results = [self._get_cached(key) for key in cache_keys]
+        
+        uncached = [idx for idx, result in enumerate(results) if result is None]
+        if len(uncached) < len(threads):
+            self.logger.info(f"  {len(threads) - len(uncached)} threads categorized from cache")
+        if not uncached:
+            return results
+        
+        # Threads with the same cache key (duplicate forwards, notifications) are
+        # sent once; the result is copied to the rest
+        duplicates_by_key: Dict[str, List[int]] = {}
+        for idx in uncached:
+            duplicates_by_key.setdefault(cache_keys[idx], []).append(idx)
+        pending = [indices[0] for indices in duplicates_by_key.values()]
+        if len(pending) < len(uncached):
+            self.logger.info(f"  {len(uncached) - len(pending)} duplicate threads share a request")
+        
+        done = len(threads) - len(uncached)
+        if progress_callback and done:
+            progress_callback(done, len(threads))
+        
+        subjects = [threads[idx].subject for idx in pending]
+        pending_keywords = [keywords_list[idx] for idx in pending]
+        samples_list = [self._get_sample_content(threads[idx]) for idx in pending]
+        
+        batches = [
+            (subjects[i:i + self.batch_size], pending_keywords[i:i + self.batch_size], samples_list[i:i + self.batch_size])
+            for i in range(0, len(pending), self.batch_size)
+        ]
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            batch_results = executor.map(lambda batch: self.api_client.categorize_threads_batch(*batch), batches)
+            for start, batch in zip(range(0, len(pending), self.batch_size), batch_results):
+                for idx, result in zip(pending[start:start + self.batch_size], batch):
+                    duplicate_indices = duplicates_by_key[cache_keys[idx]]
+                    for duplicate_idx in duplicate_indices:
+                        results[duplicate_idx] = result
+                    done += len(duplicate_indices)
+                    if not result.get('fallback'):
+                        self.result_cache.set(cache_keys[idx], {**result, 'created': time.time()})
+                if progress_callback:
+                    progress_callback(done, len(threads))
+        
+        return results
+    
+    def _get_cached(self, key: str) -> Optional[Dict]:
+        """Cached category result, or None when missing or older than the TTL"""
+        cached = self.result_cache.get(key)
+        if cached is None or time.time() - cached.get('created', 0) >= self.cache_ttl_seconds:
+            return None
+        return {name: value for name, value in cached.items() if name != 'created'}
+    
+    def _cache_key(self, subject: str, keywords: List[str]) -> str:
+        """Cache key from the model and prompt version, normalized subject and the top keywords"""
+        normalized_subject = " ".join((subject or "").lower().split())
+        raw_key = self.cache_namespace + "|" + normalized_subject + "|" + ",".join(sorted(keywords[:5]))
+        return hashlib.blake2b(raw_key.encode('utf-8'), digest_size=16).hexdigest()
+    
     def _extract_keywords(self, thread: EmailThread, top_n: int = 10) -> List[str]:
         """Extract keywords from thread messages"""
         # Combine all message bodies
         all_text = " ".join([msg.body for msg in thread.messages if msg.body])
         
-        # Simple keyword extraction - split and count
-        words = re.findall(r"[a-zA-Zа-яА-Я0-9]{3,}", all_text.lower())
-        
-        # Filter out short words and common words
-        stop_words = {
-            'the', 'is', 'at', 'which', 'on', 'and', 'a', 'an', 'as', 'to', 'for', 'of', 'in',
-            'что', 'это', 'как', 'для', 'или', 'при', 'без', 'после', 'письмо'
-        }
-        filtered_words = [w for w in words if len(w) > 3 and w not in stop_words]
-        
-        # Count frequencies
-        word_counts = Counter(filtered_words)
+        # Simple keyword extraction - split on non-word characters and count,
+        # then filter distinct words only: 4+ characters, stop words removed
+        if all_text.isascii():
+            # Fast path: byte-level translate and split, decoding distinct words only
+            byte_counts = Counter(all_text.encode('ascii').translate(_ASCII_TRANS).split())
+            word_counts = Counter({w.decode('ascii'): c for w, c in byte_counts.items() if len(w) > 3})
+        else:
+            word_counts = Counter(all_text.lower().translate(_TRANS).split())
+            word_counts = Counter({w: c for w, c in word_counts.items() if len(w) > 3})
+        word_counts -= _STOP_COUNTER
         
         # Get top keywords
         keywords = [word for word, count in word_counts.most_common(top_n)]
@@ -153,6 +280,39 @@ class Categorizer:
         
         return content
 
+    def _find_similar_name(self, name: str, sorted_names: List[str]):
+        """
+        Find an existing normalized category name equal to name or differing only
+        in the inflection ending of the last word ("вопросы по инвойсу" /
+        "вопросы по инвойсам"). Every candidate shares name up to the first
+        MIN_MERGE_STEM characters of its last word; in the sorted list they form
+        one contiguous range, and each of them is checked.
+        """
+        pos = bisect.bisect_left(sorted_names, name)
+        if pos < len(sorted_names) and sorted_names[pos] == name:
+            return name
+        
+        stem_end = name.rfind(' ') + 1 + self.MIN_MERGE_STEM
+        if stem_end > len(name):
+            return None
+        stem = name[:stem_end]
+        start = bisect.bisect_left(sorted_names, stem)
+        end = bisect.bisect_left(sorted_names, stem + '\U0010ffff', start)
+        
+        best_name = None
+        best_prefix = 0
+        for candidate in sorted_names[start:end]:
+            prefix = len(os.path.commonprefix((name, candidate)))
+            if prefix > best_prefix and self._is_inflection_match(name, candidate, prefix):
+                best_name, best_prefix = candidate, prefix
+        
+        return best_name
+    
+    @staticmethod
+    def _is_inflection_match(name: str, other: str, prefix: int) -> bool:
+        """Whether both names end in an inflection ending after their prefix shared characters"""
+        return name[prefix:] in _INFLECTION_ENDINGS and other[prefix:] in _INFLECTION_ENDINGS
+
     def _normalize_category_name(self, category_name: str) -> str:
         """Normalize category name for deduplication."""
         normalized = " ".join((category_name or "Без категории").lower().split())
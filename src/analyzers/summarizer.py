@@ -4,10 +4,14 @@ Generates structured AI summaries for email threads following formal report temp
 """
 
 import logging
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+from typing import Callable, Dict, List, Optional
 from src.analyzers.categorizer import ThreadCategory
 from src.utils.api_client import ClaudeAPIClient
 from src.parsers.content_cleaner import ContentCleaner
+from src.parsers.msg_parser import MessageBatch
 
 
 class Summarizer:
@@ -18,18 +22,23 @@ class Summarizer:
         self.config = config
         self.api_client = api_client
         self.content_cleaner = ContentCleaner(config)
+        # Memoized by body text: repeated bodies (auto-replies, re-runs) are cleaned once
+        self._extract_main_content = lru_cache(maxsize=4096)(self.content_cleaner.extract_main_content)
         
         sum_config = config.get('summarization', {})
         self.max_length = sum_config.get('max_length', 300)
         self.include_participants = sum_config.get('include_participants', True)
         self.include_dates = sum_config.get('include_dates', True)
+        self.concurrency = max(1, int(sum_config.get('concurrency', 6)))
     
-    def summarize_categories(self, categories: List[ThreadCategory]) -> dict:
+    def summarize_categories(self, categories: List[ThreadCategory],
+                             progress_callback: Optional[Callable[[int, int], None]] = None) -> dict:
         """
         Generate structured summaries for all categories
         
         Args:
             categories: List of ThreadCategory objects
+            progress_callback: Optional callable(done, total) called after each category
         
         Returns:
             Dict mapping category_id to structured summary data
@@ -37,12 +46,17 @@ class Summarizer:
         self.logger.info(f"Generating structured summaries for {len(categories)} categories...")
         
         summaries = {}
+        if not categories:
+            return summaries
         
-        for category in categories:
-            self.logger.info(f"  Summarizing: {category.name}")
-            
-            summary_data = self._summarize_category(category)
-            summaries[category.category_id] = summary_data
+        # Categories are independent API round-trips: run them concurrently,
+        # collecting results in category order (it defines report numbering)
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(categories))) as executor:
+            results = executor.map(self._summarize_category, categories)
+            for done, (category, summary_data) in enumerate(zip(categories, results), start=1):
+                summaries[category.category_id] = summary_data
+                if progress_callback:
+                    progress_callback(done, len(categories))
         
         self.logger.info("✓ All summaries generated")
         
@@ -50,33 +64,30 @@ class Summarizer:
     
     def _summarize_category(self, category: ThreadCategory) -> dict:
         """Generate structured summary for a single category"""
+        self.logger.info(f"  Summarizing: {category.name}")
         
-        # Collect all messages from threads in this category
+        # Collect all messages from threads in this category, column by column
+        batch = MessageBatch.from_messages(
+            msg for thread in category.threads for msg in thread.messages
+        )
+        
+        # Clean message content
         all_messages = []
-        all_participants = set()
-        dates = []
+        for body in batch.bodies:
+            cleaned = self._extract_main_content(body)
+            if cleaned:
+                all_messages.append(cleaned)
         
-        for thread in category.threads:
-            for msg in thread.messages:
-                # Clean message content
-                cleaned = self.content_cleaner.extract_main_content(msg.body)
-                if cleaned:
-                    all_messages.append(cleaned)
-                
-                # Collect participants
-                all_participants.add(msg.sender)
-                all_participants.update(msg.recipients)
-                
-                # Collect dates
-                if msg.date:
-                    dates.append(msg.date)
+        # Collect participants and dates
+        all_participants = set(batch.senders)
+        all_participants.update(chain.from_iterable(batch.recipients))
+        dates = batch.dates
         
         # Format date range
         date_range = "Н/Д"
         if dates:
-            dates.sort()
-            start = dates[0].strftime('%d.%m.%Y')
-            end = dates[-1].strftime('%d.%m.%Y')
+            start = min(dates).strftime('%d.%m.%Y')
+            end = max(dates).strftime('%d.%m.%Y')
             date_range = f"{start}–{end}" if start != end else start
         
         # Generate structured AI summary
@@ -3,12 +3,23 @@ Attachment Manager
 Organizes and saves email attachments by category
 """
 
+import hashlib
 import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple, Union
 from src.analyzers.categorizer import ThreadCategory
 
 
+# Attachment payload: an in-memory buffer or a readable binary file object
+AttachmentData = Union[bytes, bytearray, memoryview, BinaryIO]
+
+# Chunk size used when streaming file-object payloads to disk
+COPY_BUFFER_SIZE = 1 << 20
+
+
 class AttachmentManager:
     """Manage email attachments"""
     
@@ -18,6 +29,12 @@ class AttachmentManager:
         
         att_config = config.get('report', {}).get('attachments', {})
         self.organize_by_category = att_config.get('organize_by_category', True)
+        # Per-folder next duplicate suffix by base filename, and names already taken
+        # (seeded from one directory listing per folder), so renames need no stat calls
+        self._folder_name_counts: Dict[Path, Dict[str, int]] = {}
+        self._folder_taken_names: Dict[Path, Set[str]] = {}
+        # Content digest -> first saved copy, used to link identical payloads
+        self._seen_hashes: Dict[str, Path] = {}
     
     def save_attachments(self, categories: List[ThreadCategory], base_output_path: Path) -> Dict:
         """
@@ -39,8 +56,13 @@ class AttachmentManager:
         stats = {
             'total_attachments': 0,
             'categories_with_attachments': 0,
-            'saved_files': []
+            'saved_files': [],
+            'deduplicated_attachments': 0
         }
+        pending_writes: List[Tuple[Path, AttachmentData, Optional[Path]]] = []
+        self._folder_name_counts.clear()
+        self._folder_taken_names.clear()
+        self._seen_hashes.clear()
         
         # Process each category in the same order used for report sections (4.1, 4.2, ...)
         for idx, category in enumerate(categories, 1):
@@ -57,18 +79,36 @@ class AttachmentManager:
             
             self.logger.info(f"  Processing category: {category.name}")
             
-            # Save attachments from all threads in this category
+            # Collect attachments from all threads in this category; output names
+            # are assigned here, single-threaded, so duplicate renames cannot race
             for thread in category.threads:
                 for message in thread.messages:
                     if not message.has_attachments:
                         continue
                     
                     for attachment in message.attachments:
-                        self._save_attachment(
-                            attachment=attachment,
-                            category_folder=category_folder,
-                            stats=stats
-                        )
+                        pending_write = self._prepare_attachment(attachment, category_folder)
+                        if pending_write:
+                            pending_writes.append(pending_write)
+        
+        # Write first copies concurrently to overlap disk I/O, then link duplicates to them
+        originals = [item for item in pending_writes if item[2] is None]
+        duplicates = [item for item in pending_writes if item[2] is not None]
+        
+        if originals:
+            max_workers = min(16, (os.cpu_count() or 1) * 2, len(originals))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(lambda item: self._write_attachment(*item), originals))
+        else:
+            results = []
+        results.extend(self._write_attachment(*item) for item in duplicates)
+        
+        for (output_path, _, duplicate_of), saved in zip(originals + duplicates, results):
+            if saved:
+                stats['total_attachments'] += 1
+                stats['saved_files'].append(str(output_path))
+                if duplicate_of is not None:
+                    stats['deduplicated_attachments'] += 1
         
         self.logger.info(f"✓ Saved {stats['total_attachments']} attachments in {stats['categories_with_attachments']} categories")
         
@@ -76,44 +116,102 @@ class AttachmentManager:
     
     def _save_attachment(self, attachment: dict, category_folder: Path, stats: dict):
         """Save a single attachment"""
+        pending_write = self._prepare_attachment(attachment, category_folder)
+        if not pending_write:
+            return
+        
+        output_path, data, duplicate_of = pending_write
+        if self._write_attachment(output_path, data, duplicate_of):
+            stats['total_attachments'] += 1
+            stats['saved_files'].append(str(output_path))
+            if duplicate_of is not None:
+                stats['deduplicated_attachments'] = stats.get('deduplicated_attachments', 0) + 1
+    
+    def _prepare_attachment(self, attachment: dict, category_folder: Path) -> Optional[Tuple[Path, AttachmentData, Optional[Path]]]:
+        """
+        Choose a safe, unique output path for an attachment.
+        Returns (path, data, duplicate_of) or None to skip; duplicate_of is the
+        first saved copy of identical content, if any. File-object payloads are
+        streamed as-is and not deduplicated, so they are never read twice.
+        """
         
         filename = self._safe_attachment_filename(attachment.get('filename', 'unnamed'))
         data = attachment.get('data')
         
         if not data:
             self.logger.warning(f"  No data for attachment: {filename}")
-            return
+            return None
+        
+        # The name must stay a single path component inside the category folder;
+        # a string check is enough here, no filesystem resolve per attachment
+        if filename in ('.', '..') or Path(filename).name != filename:
+            self.logger.error(f"    Unsafe attachment path blocked: {filename}")
+            return None
         
         # Handle duplicate filenames
-        output_path = category_folder / filename
-        counter = 1
-        while output_path.exists():
-            name_parts = filename.rsplit('.', 1)
-            if len(name_parts) == 2:
-                new_name = f"{name_parts[0]}_{counter}.{name_parts[1]}"
-            else:
-                new_name = f"{filename}_{counter}"
-            output_path = category_folder / new_name
+        output_path = category_folder / self._unique_filename(category_folder, filename)
+        
+        if hasattr(data, 'read'):
+            return output_path, data, None
+        
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        duplicate_of = self._seen_hashes.get(digest)
+        if duplicate_of is None:
+            self._seen_hashes[digest] = output_path
+        
+        return output_path, data, duplicate_of
+    
+    def _unique_filename(self, category_folder: Path, filename: str) -> str:
+        """Return filename, or filename with a _N suffix if already used in the folder"""
+        taken = self._folder_taken_names.get(category_folder)
+        if taken is None:
+            taken = set(os.listdir(category_folder)) if category_folder.is_dir() else set()
+            self._folder_taken_names[category_folder] = taken
+        counts = self._folder_name_counts.setdefault(category_folder, {})
+        
+        counter = counts.get(filename, 0)
+        new_name = self._suffixed_filename(filename, counter)
+        while new_name in taken:
             counter += 1
+            new_name = self._suffixed_filename(filename, counter)
         
-        # Save file
+        counts[filename] = counter + 1
+        taken.add(new_name)
+        return new_name
+    
+    def _suffixed_filename(self, filename: str, counter: int) -> str:
+        """Insert _counter before the extension (counter 0 keeps the name)"""
+        if not counter:
+            return filename
+        name_parts = filename.rsplit('.', 1)
+        if len(name_parts) == 2:
+            return f"{name_parts[0]}_{counter}.{name_parts[1]}"
+        return f"{filename}_{counter}"
+    
+    def _write_attachment(self, output_path: Path, data: AttachmentData, duplicate_of: Optional[Path] = None) -> bool:
+        """Write attachment data to its reserved path, hard-linking identical content when possible"""
         try:
-            resolved_output = output_path.resolve()
-            resolved_category = category_folder.resolve()
-            if resolved_category not in resolved_output.parents and resolved_output != resolved_category:
-                self.logger.error(f"    Unsafe attachment path blocked: {filename}")
-                return
-
-            with open(output_path, 'wb') as f:
-                f.write(data)
+            if duplicate_of is not None:
+                try:
+                    os.link(duplicate_of, output_path)
+                    self.logger.debug(f"    Linked duplicate: {output_path.name} -> {duplicate_of.name}")
+                    return True
+                except OSError:
+                    # No hard link support (or first copy missing): fall back to a regular write
+                    pass
             
-            stats['total_attachments'] += 1
-            stats['saved_files'].append(str(output_path))
+            with open(output_path, 'wb') as f:
+                if hasattr(data, 'read'):
+                    shutil.copyfileobj(data, f, length=COPY_BUFFER_SIZE)
+                else:
+                    f.write(data)
             
             self.logger.debug(f"    Saved: {output_path.name}")
+            return True
             
         except Exception as e:
-            self.logger.error(f"    Error saving {filename}: {e}")
+            self.logger.error(f"    Error saving {output_path.name}: {e}")
+            return False
     
     def _sanitize_filename(self, name: str, max_length: int = 50) -> str:
         """Sanitize filename for filesystem"""
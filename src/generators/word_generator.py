@@ -3,13 +3,19 @@ Word Document Generator
 Creates formal monthly reports following the consultant/operator section template
 """
 
+import io
 import logging
+import os
+from copy import deepcopy
 from pathlib import Path
 from datetime import datetime
 from docx import Document
 from docx.shared import Pt, RGBColor, Inches
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.table import WD_TABLE_ALIGNMENT, WD_ALIGN_VERTICAL
+from docx.enum.table import WD_TABLE_ALIGNMENT
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
 from typing import Dict, List
 
 
@@ -40,6 +46,16 @@ class WordReportGenerator:
         5: 'мая', 6: 'июня', 7: 'июля', 8: 'августа',
         9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
     }
+    _MONTHS_RU_CAP = {k: v.capitalize() for k, v in MONTHS_RU.items()}
+    
+    # Fixed header sizes/colors and table column widths (Length values are immutable, so shared)
+    TITLE_SIZE = Pt(18)
+    TITLE_COLOR = RGBColor(68, 114, 196)
+    SUBTITLE_SIZE = Pt(14)
+    SMALL_SIZE = Pt(10)
+    COLUMN_WIDTHS = (Inches(0.6), Inches(7.0), Inches(1.8))
+    # Rendered table rows kept for re-generation with unchanged categories
+    ROW_CACHE_SIZE = 256
     
     def __init__(self, config: dict):
         self.logger = logging.getLogger(__name__)
@@ -49,6 +65,11 @@ class WordReportGenerator:
         self.table_style = report_config.get('table_style', {})
         self.font = self.table_style.get('font', 'Calibri')
         self.font_size = self.table_style.get('font_size', 11)
+        self._font_size_pt = Pt(self.font_size)
+        # Table row skeletons by (cell style id, column widths), see _row_template
+        self._row_templates = {}
+        # Finished rows by (cell style id, values, skeleton), oldest evicted first
+        self._row_cache = {}
     
     def generate_report(self, summaries: Dict, output_path: Path, report_month: str = None) -> Path:
         """Generate structured Word document report"""
@@ -56,135 +77,231 @@ class WordReportGenerator:
         
         doc = Document()
         
-        # Set default font
-        style = doc.styles['Normal']
-        font = style.font
+        # Set default font (style looked up by name once and reused below)
+        normal_style = doc.styles['Normal']
+        font = normal_style.font
         font.name = self.font
-        font.size = Pt(self.font_size)
+        font.size = self._font_size_pt
+        
+        # Table cell styles (fonts are set once per style instead of per run)
+        cell_styles = self._add_cell_styles(doc, normal_style)
         
         # Add header
         self._add_header(doc, report_month)
         
         # Add section 4 with subsections in investor-style table
-        self._add_section_4_table(doc, summaries)
+        self._add_section_4_table(doc, summaries, cell_styles)
         
         # Add statistics
         self._add_statistics(doc, summaries)
         
         # Save document
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        doc.save(str(output_path))
+        self._save_atomic(doc, output_path)
         
         self.logger.info(f"✓ Report saved: {output_path}")
         
         return output_path
     
+    def _save_atomic(self, doc, output_path: Path):
+        """
+        Serialize the document in memory, write it with one buffered write to a
+        temp file next to the target and rename it into place, so a failed save
+        never leaves a truncated report behind.
+        """
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        
+        tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+    
+    def _add_cell_styles(self, doc, normal_style):
+        """Add paragraph styles for table cells; returns (body_style, header_style)"""
+        styles = doc.styles
+        
+        cell_style = styles.add_style('ReportCell', WD_STYLE_TYPE.PARAGRAPH)
+        cell_style.base_style = normal_style
+        cell_style.font.name = self.font
+        cell_style.font.size = self._font_size_pt
+        
+        header_style = styles.add_style('ReportCellHeader', WD_STYLE_TYPE.PARAGRAPH)
+        header_style.base_style = cell_style
+        header_style.font.bold = True
+        
+        return cell_style, header_style
+    
     def _add_header(self, doc, report_month: str = None):
         """Add report header"""
+        now = datetime.now()
         
         # Title
         title = doc.add_paragraph()
         title.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = title.add_run(self.TRANSLATIONS_RU['title'])
         run.bold = True
-        run.font.size = Pt(18)
-        run.font.color.rgb = RGBColor(68, 114, 196)
+        run.font.size = self.TITLE_SIZE
+        run.font.color.rgb = self.TITLE_COLOR
         
         # Subtitle (month/year)
         if not report_month:
-            now = datetime.now()
-            month_ru = self.MONTHS_RU[now.month].capitalize()
-            report_month = f"{month_ru} {now.year}"
+            report_month = f"{self._MONTHS_RU_CAP[now.month]} {now.year}"
         
         subtitle = doc.add_paragraph()
         subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = subtitle.add_run(report_month)
-        run.font.size = Pt(14)
+        run.font.size = self.SUBTITLE_SIZE
         
         # Generation date
-        now = datetime.now()
         date_ru = f"{now.day} {self.MONTHS_RU[now.month]} {now.year} г."
         
         date_para = doc.add_paragraph()
         date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
         run = date_para.add_run(f"{self.TRANSLATIONS_RU['generated']}: {date_ru}")
-        run.font.size = Pt(10)
+        run.font.size = self.SMALL_SIZE
         run.italic = True
         
         # Add spacing
         doc.add_paragraph()
     
-    def _add_section_4_table(self, doc, summaries: Dict):
+    def _add_section_4_table(self, doc, summaries: Dict, cell_styles):
         """
         Add section in investor-style table:
         col1 = № (4 / 4.1 / 4.2 ...)
         col2 = content and result
         col3 = period/date
         """
-        table = doc.add_table(rows=1, cols=3)
+        table = doc.add_table(rows=0, cols=3)
         table.style = "Table Grid"
         table.alignment = WD_TABLE_ALIGNMENT.CENTER
 
-        table.columns[0].width = Inches(0.6)
-        table.columns[1].width = Inches(7.0)
-        table.columns[2].width = Inches(1.8)
+        for column, width in zip(table.columns, self.COLUMN_WIDTHS):
+            column.width = width
+
+        body_style, header_style = cell_styles
 
         # Row "4"
-        header_cells = table.rows[0].cells
-        header_cells[0].text = "4"
-        header_cells[1].text = "Работа с консультантами и операторами в рамках реализации проекта."
-        header_cells[2].text = ""
-        self._format_row(header_cells, is_header=True)
+        self._append_table_row(
+            table,
+            ["4", "Работа с консультантами и операторами в рамках реализации проекта.", ""],
+            header_style,
+        )
 
         # Rows "4.1", "4.2", ...
         for idx, (_, summary_data) in enumerate(summaries.items(), 1):
-            row_cells = table.add_row().cells
-            row_cells[0].text = f"4.{idx}"
-            row_cells[1].text = self._build_investor_cell_text(summary_data)
-            row_cells[2].text = summary_data.get("date_range", "")
-            self._format_row(row_cells, is_header=False)
+            self._append_table_row(
+                table,
+                [f"4.{idx}", self._build_investor_cell_text(summary_data), summary_data.get("date_range", "")],
+                body_style,
+            )
 
     def _build_investor_cell_text(self, summary_data: Dict) -> str:
         """Build concise narrative like in investor sample."""
         actions = summary_data.get("actions", []) or []
-        actions_text = " ".join(a.strip() for a in actions if a and a.strip())
+        # Keep text concise for table layout.
+        actions_text = " ".join(filter(None, (a.strip() for a in actions if a)))[:900].rstrip()
         if not actions_text:
             actions_text = "Проведена рабочая переписка по профильному вопросу."
 
-        result = (summary_data.get("result") or "").strip()
+        result = (summary_data.get("result") or "").strip()[:300].rstrip()
         if not result:
             result = "Статус уточняется."
 
-        # Keep text concise for table layout.
-        actions_text = actions_text[:900].rstrip()
-        result = result[:300].rstrip()
-
-        return f"{actions_text}\n\nРезультат работ: {result}"
-
-    def _format_row(self, cells, is_header: bool):
-        """Apply alignment/font to row cells."""
-        for idx, cell in enumerate(cells):
-            cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            for paragraph in cell.paragraphs:
-                if idx == 0:
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                elif idx == 2:
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                else:
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.LEFT
-                for run in paragraph.runs:
-                    run.font.name = self.font
-                    run.font.size = Pt(self.font_size)
-                    if is_header:
-                        run.bold = True
+        return "".join((actions_text, "\n\nРезультат работ: ", result))
+
+    def _append_table_row(self, table, values: List[str], style):
+        """
+        Append a row built directly as <w:tr> XML, skipping python-docx's
+        per-row/per-cell wrapper objects. Finished rows are cached by their
+        values, so regenerating a report only builds the rows that changed.
+        """
+        key = (style.style_id, tuple(values), id(self._row_template(table, style)))
+        tr = self._row_cache.get(key)
+        if tr is None:
+            tr = self._build_table_row(table, values, style)
+            if len(self._row_cache) >= self.ROW_CACHE_SIZE:
+                del self._row_cache[next(iter(self._row_cache))]
+            self._row_cache[key] = tr
+
+        table._tbl.append(deepcopy(tr))
+
+    def _build_table_row(self, table, values: List[str], style):
+        """<w:tr> for values: the cached skeleton plus one text run per non-empty cell"""
+        tr = deepcopy(self._row_template(table, style))
+
+        for text, p in zip(values, tr.iter(qn('w:p'))):
+            if text:
+                r = OxmlElement('w:r')
+                # Line breaks inside a cell are <w:br/>, as python-docx writes them
+                for line_idx, line in enumerate(text.split('\n')):
+                    if line_idx:
+                        r.append(OxmlElement('w:br'))
+                    if line:
+                        t = OxmlElement('w:t')
+                        t.set(qn('xml:space'), 'preserve')
+                        t.text = line
+                        r.append(t)
+                p.append(r)
+
+        return tr
+
+    def _row_template(self, table, style):
+        """
+        Empty <w:tr> skeleton for the table's grid and a cell style, built once
+        per generator and reused across rows and reports. Cells are vertically
+        centered; the content column is left-aligned, the others centered.
+        """
+        widths = tuple(grid_col.w for grid_col in table._tbl.tblGrid.gridCol_lst)
+        key = (style.style_id, widths)
+        template = self._row_templates.get(key)
+        if template is not None:
+            return template
+
+        tr = OxmlElement('w:tr')
+        for idx, width in enumerate(widths):
+            tc = OxmlElement('w:tc')
+
+            tc_pr = OxmlElement('w:tcPr')
+            if width is not None:
+                tc_w = OxmlElement('w:tcW')
+                tc_w.set(qn('w:w'), str(width.twips))
+                tc_w.set(qn('w:type'), 'dxa')
+                tc_pr.append(tc_w)
+            v_align = OxmlElement('w:vAlign')
+            v_align.set(qn('w:val'), 'center')
+            tc_pr.append(v_align)
+            tc.append(tc_pr)
+
+            p = OxmlElement('w:p')
+            p_pr = OxmlElement('w:pPr')
+            p_style = OxmlElement('w:pStyle')
+            p_style.set(qn('w:val'), style.style_id)
+            p_pr.append(p_style)
+            jc = OxmlElement('w:jc')
+            jc.set(qn('w:val'), 'left' if idx == 1 else 'center')
+            p_pr.append(jc)
+            p.append(p_pr)
+
+            tc.append(p)
+            tr.append(tc)
+
+        self._row_templates[key] = tr
+        return tr
     
     def _add_statistics(self, doc, summaries: Dict):
         """Add report statistics"""
         
         doc.add_page_break()
         
-        total_messages = sum(s['message_count'] for s in summaries.values())
-        total_attachments = sum(s['attachment_count'] for s in summaries.values())
+        total_messages = total_attachments = 0
+        for summary_data in summaries.values():
+            total_messages += summary_data['message_count']
+            total_attachments += summary_data['attachment_count']
         
         heading = doc.add_paragraph()
         heading.add_run(self.TRANSLATIONS_RU['statistics']).bold = True
@@ -5,7 +5,16 @@ Remove signatures, disclaimers, quoted text, etc.
 
 import re
 import logging
-from typing import List
+from html import unescape
+
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+_MULTI_SPACE = re.compile(r' +')
+_MULTI_NL = re.compile(r'\n{3,}')
+_ON_WROTE = re.compile(r'^On .* wrote:')
+# First non-whitespace character is '>' (matched in place, no stripped copy of the line)
+_QUOTED_LINE = re.compile(r'\s*>')
+_REPLY_HEADER = re.compile(r'\n(?:On .* wrote:|From:.*?Sent:)')
 
 
 class ContentCleaner:
@@ -35,6 +44,10 @@ class ContentCleaner:
         r'-----Original Message-----',
     ]
     
+    # Each list compiled once into a single alternation, so a line is scanned once per list
+    _SIGNATURE_RE = re.compile('|'.join(f'(?:{p})' for p in SIGNATURE_PATTERNS), re.IGNORECASE)
+    _DISCLAIMER_RE = re.compile('|'.join(f'(?:{p})' for p in DISCLAIMER_PATTERNS), re.IGNORECASE | re.DOTALL)
+    
     def __init__(self, config: dict = None):
         self.logger = logging.getLogger(__name__)
         self.config = config or {}
@@ -52,16 +65,24 @@ class ContentCleaner:
             return ""
         
         text = self._remove_html_tags(text)
-        lines = text.split('\n')
-        
-        if self.remove_signatures:
-            lines = self._remove_signatures(lines)
         
-        if self.remove_disclaimers:
-            lines = self._remove_disclaimers(lines)
-        
-        if self.remove_quoted:
-            lines = self._remove_quoted_text(lines)
+        # Single pass over the lines: everything from the first signature line on is
+        # dropped, disclaimer and quoted lines are skipped, and a reply header ends the body
+        lines = []
+        for line in text.split('\n'):
+            if self.remove_signatures and self._SIGNATURE_RE.search(line):
+                break
+            
+            if self.remove_disclaimers and self._is_disclaimer(line):
+                continue
+            
+            if self.remove_quoted:
+                if _QUOTED_LINE.match(line):
+                    continue
+                if _ON_WROTE.match(line):
+                    break
+            
+            lines.append(line)
         
         cleaned = '\n'.join(lines)
         cleaned = self._normalize_whitespace(cleaned)
@@ -70,73 +91,26 @@ class ContentCleaner:
     
     def _remove_html_tags(self, text: str) -> str:
         """Remove HTML tags"""
-        text = re.sub(r'<[^>]+>', '', text)
-        text = text.replace('&nbsp;', ' ')
-        text = text.replace('&lt;', '<')
-        text = text.replace('&gt;', '>')
-        text = text.replace('&amp;', '&')
+        text = _HTML_TAG.sub('', text)
+        if '&' in text:
+            # All entities in one pass; &nbsp; stays a plain space as before
+            text = unescape(text).replace('\xa0', ' ')
         return text
     
-    def _remove_signatures(self, lines: List[str]) -> List[str]:
-        """Remove email signatures"""
-        result = []
-        signature_found = False
-        
-        for line in lines:
-            if not signature_found:
-                for pattern in self.SIGNATURE_PATTERNS:
-                    if re.search(pattern, line, re.IGNORECASE):
-                        signature_found = True
-                        break
-            
-            if not signature_found:
-                result.append(line)
-        
-        return result
-    
-    def _remove_disclaimers(self, lines: List[str]) -> List[str]:
-        """Remove legal disclaimers"""
-        result = []
-        
-        for line in lines:
-            starts_disclaimer = any(
-                re.search(pattern, line, re.IGNORECASE | re.DOTALL)
-                for pattern in self.DISCLAIMER_PATTERNS
-            )
-            
-            if starts_disclaimer:
-                continue
-            
-            if len(line) > 500 and 'confidential' in line.lower():
-                continue
-            
-            result.append(line)
-        
-        return result
-    
-    def _remove_quoted_text(self, lines: List[str]) -> List[str]:
-        """Remove quoted/replied text"""
-        result = []
-        
-        for line in lines:
-            if line.strip().startswith('>'):
-                continue
-            
-            if re.match(r'^On .* wrote:', line):
-                break
-            
-            result.append(line)
-        
-        return result
+    def _is_disclaimer(self, line: str) -> bool:
+        """Whether a line is part of a legal disclaimer"""
+        if self._DISCLAIMER_RE.search(line):
+            return True
+        return len(line) > 500 and 'confidential' in line.lower()
     
     def _normalize_whitespace(self, text: str) -> str:
         """Normalize whitespace"""
-        text = re.sub(r' +', ' ', text)
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = _MULTI_SPACE.sub(' ', text)
+        text = _MULTI_NL.sub('\n\n', text)
         return text
     
     def extract_main_content(self, text: str) -> str:
         """Extract only the main content"""
         cleaned = self.clean(text)
-        parts = re.split(r'\n(?:On .* wrote:|From:.*?Sent:)', cleaned, maxsplit=1)
-        return parts[0].strip() if parts else cleaned
+        match = _REPLY_HEADER.search(cleaned)
+        return (cleaned[:match.start()] if match else cleaned).strip()
@@ -3,20 +3,66 @@ Outlook MSG file parser
 Extracts email content, metadata, and attachments
 """
 
-import extract_msg
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 import logging
-from typing import Dict, List, Optional
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import hashlib
 import struct
+import sys
+
+
+@lru_cache(maxsize=None)
+def _extract_msg():
+    """Import extract_msg (and olefile, compressed_rtf, ...) on first parse, not at module import"""
+    import extract_msg
+    return extract_msg
+
+
+@lru_cache(maxsize=None)
+def _date_parser():
+    """dateutil's parser module, imported on first string date"""
+    from dateutil import parser as date_parser
+    return date_parser
+
+
+@lru_cache(maxsize=4096)
+def _msg_id_for(path: str) -> str:
+    """12-hex-char message ID derived from the file path"""
+    return hashlib.blake2b(path.encode(), digest_size=6).hexdigest()
+
+
+logger = logging.getLogger(__name__)
+
+_HEADER_DATE_RE = re.compile(r'^date:(.*)$', re.IGNORECASE | re.MULTILINE)
+
+
+@lru_cache(maxsize=4096)
+def _shared_subject(subject: str) -> str:
+    """
+    First-seen copy of an equal subject. Kept out of sys.intern since subjects
+    can be long; the bound keeps a long-running server from holding every
+    subject it has parsed.
+    """
+    return subject
 
 
 class EmailMessage:
     """Represents a parsed email message"""
     
+    # Fixed attribute set: no per-instance __dict__ across thousands of messages
+    __slots__ = (
+        'file_path', 'msg_id',
+        'subject', 'sender', 'recipients', 'cc', 'date', 'message_id', 'in_reply_to', 'references',
+        'body', 'html_body', 'attachments', 'has_attachments',
+    )
+    
     def __init__(self, msg_file: Path):
-        self.logger = logging.getLogger(__name__)
         self.file_path = msg_file
         self.msg_id = self._generate_msg_id(msg_file)
         
@@ -48,12 +94,12 @@ class EmailMessage:
     
     def _generate_msg_id(self, msg_file: Path) -> str:
         """Generate unique ID for message"""
-        return hashlib.md5(str(msg_file).encode()).hexdigest()[:12]
+        return _msg_id_for(str(msg_file))
     
     def _parse(self):
         """Parse the MSG file"""
         try:
-            msg = extract_msg.Message(str(self.file_path))
+            msg = _extract_msg().Message(str(self.file_path))
             
             # Extract metadata
             self.subject = msg.subject or "(No Subject)"
@@ -76,12 +122,33 @@ class EmailMessage:
             
             msg.close()
             
-            self.logger.debug(f"Parsed: {self.subject[:40]} | Date: {self.date}")
+            self._intern_metadata()
+            
+            logger.debug(f"Parsed: {self.subject[:40]} | Date: {self.date}")
             
         except Exception as e:
-            self.logger.error(f"Error parsing {self.file_path}: {e}")
+            logger.error(f"Error parsing {self.file_path}: {e}")
             raise
     
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+    
+    def __setstate__(self, state):
+        # Messages parsed in worker processes arrive unpickled with fresh string
+        # copies; share the repeated ones again in this process
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._intern_metadata()
+    
+    def _intern_metadata(self):
+        """Share one copy of repeated addresses, subjects and attachment names across messages"""
+        self.subject = _shared_subject(self.subject)
+        self.sender = sys.intern(self.sender)
+        self.recipients = [sys.intern(r) for r in self.recipients]
+        self.cc = [sys.intern(r) for r in self.cc]
+        for attachment in self.attachments:
+            attachment['filename'] = sys.intern(attachment['filename'])
+    
     def _extract_date_robust(self, msg) -> Optional[datetime]:
         """Extract date using multiple methods"""
         
@@ -94,15 +161,14 @@ class EmailMessage:
                 if value:
                     try:
                         if isinstance(value, datetime):
-                            self.logger.debug(f"Date from {prop}: {value}")
+                            logger.debug(f"Date from {prop}: {value}")
                             return value
                         elif isinstance(value, str):
-                            from dateutil import parser as date_parser
-                            parsed = date_parser.parse(value)
-                            self.logger.debug(f"Date from {prop} (parsed): {parsed}")
+                            parsed = _date_parser().parse(value)
+                            logger.debug(f"Date from {prop} (parsed): {parsed}")
                             return parsed
                     except Exception as e:
-                        self.logger.debug(f"Failed to parse {prop}: {e}")
+                        logger.debug(f"Failed to parse {prop}: {e}")
                         continue
         
         # Method 2: Try accessing raw properties
@@ -122,38 +188,41 @@ class EmailMessage:
                     if hasattr(msg, '_getTypedData'):
                         value = msg._getTypedData(prop_id)
                         if value and isinstance(value, datetime):
-                            self.logger.debug(f"Date from property {prop_id}: {value}")
+                            logger.debug(f"Date from property {prop_id}: {value}")
                             return value
                 except:
                     continue
         except Exception as e:
-            self.logger.debug(f"Raw property access failed: {e}")
+            logger.debug(f"Raw property access failed: {e}")
         
         # Method 3: Try msg.header for received date
         try:
             if hasattr(msg, 'header') and msg.header:
                 header = msg.header
-                # Look for Date: header
-                for line in header.split('\n'):
-                    if line.lower().startswith('date:'):
-                        date_str = line.split(':', 1)[1].strip()
-                        from dateutil import parser as date_parser
-                        parsed = date_parser.parse(date_str)
-                        self.logger.debug(f"Date from header: {parsed}")
-                        return parsed
+                # Look for Date: header (raw text, or an already parsed email.message.Message)
+                if isinstance(header, str):
+                    match = _HEADER_DATE_RE.search(header)
+                    date_str = match.group(1).strip() if match else None
+                else:
+                    date_str = header.get('Date')
+                
+                if date_str:
+                    parsed = _date_parser().parse(date_str)
+                    logger.debug(f"Date from header: {parsed}")
+                    return parsed
         except Exception as e:
-            self.logger.debug(f"Header parsing failed: {e}")
+            logger.debug(f"Header parsing failed: {e}")
         
         # Method 4: File modification time as last resort
         try:
             file_mtime = self.file_path.stat().st_mtime
             file_date = datetime.fromtimestamp(file_mtime)
-            self.logger.info(f"Using file modification time for {self.file_path.name}: {file_date}")
+            logger.info(f"Using file modification time for {self.file_path.name}: {file_date}")
             return file_date
         except:
             pass
         
-        self.logger.warning(f"Could not extract date from {self.file_path.name}")
+        logger.warning(f"Could not extract date from {self.file_path.name}")
         return None
     
     def _parse_recipients(self, recipients_str: Optional[str]) -> List[str]:
@@ -170,14 +239,17 @@ class EmailMessage:
         
         try:
             for attachment in msg.attachments:
+                # .data decodes the OLE stream on every access: read it once
+                data = getattr(attachment, 'data', None)
+                
                 att_info = {
                     'filename': attachment.longFilename or attachment.shortFilename or 'unnamed',
-                    'size': len(attachment.data) if hasattr(attachment, 'data') else 0,
-                    'data': attachment.data if hasattr(attachment, 'data') else None
+                    'size': len(data) if data else 0,
+                    'data': data
                 }
                 attachments.append(att_info)
         except Exception as e:
-            self.logger.warning(f"Error extracting attachments: {e}")
+            logger.warning(f"Error extracting attachments: {e}")
         
         return attachments
     
@@ -208,38 +280,114 @@ class EmailMessage:
         return f"EmailMessage(subject='{self.subject[:50]}...', date={date_str})"
 
 
+class MessageBatch:
+    """
+    Column-wise view of a list of messages: one list per field
+    instead of one attribute dict per message, for stages that aggregate fields
+    across many messages.
+    """
+    
+    __slots__ = ('bodies', 'senders', 'recipients', 'dates')
+    
+    def __init__(self):
+        self.bodies: List[str] = []
+        self.senders: List[str] = []
+        self.recipients: List[List[str]] = []
+        self.dates: List[datetime] = []  # only messages with a known date
+    
+    @classmethod
+    def from_messages(cls, messages) -> 'MessageBatch':
+        """Build the columns in one pass over the messages"""
+        batch = cls()
+        for msg in messages:
+            batch.bodies.append(msg.body)
+            batch.senders.append(msg.sender)
+            batch.recipients.append(msg.recipients)
+            if msg.date:
+                batch.dates.append(msg.date)
+        return batch
+    
+    def __len__(self):
+        return len(self.bodies)
+
+
+def _parse_one(msg_file: Path) -> Tuple[Optional[EmailMessage], Optional[str]]:
+    """Parse one MSG file; returns (message, None) or (None, error). Top-level so worker processes can pickle it"""
+    try:
+        return EmailMessage(msg_file), None
+    except Exception as e:
+        return None, str(e)
+
+
 class MSGParser:
     """Parse multiple MSG files"""
     
-    def __init__(self):
+    # Below this many files a process pool costs more to start than it saves
+    PARALLEL_MIN_FILES = 8
+    
+    def __init__(self, max_workers: int = 1):
         self.logger = logging.getLogger(__name__)
+        self.max_workers = max(1, int(max_workers or 1))
+    
+    def parse_single(self, msg_file: Path) -> Optional[EmailMessage]:
+        """Parse one MSG file in-process; None (error logged) if it cannot be parsed"""
+        message, error = _parse_one(msg_file)
+        if message is None:
+            self.logger.error(f"Failed to parse {msg_file}: {error}")
+        return message
     
-    def parse_files(self, msg_files: List[Path]) -> List[EmailMessage]:
-        """Parse multiple MSG files"""
+    def parse_files(self, msg_files: List[Path],
+                    progress_callback: Optional[Callable[[int, int], None]] = None) -> List[EmailMessage]:
+        """
+        Parse multiple MSG files (in worker processes when max_workers > 1).
+        progress_callback(done, total) is called after each file.
+        """
         messages = []
+        total = len(msg_files)
         
-        self.logger.info(f"Parsing {len(msg_files)} MSG files...")
+        self.logger.info(f"Parsing {total} MSG files...")
         
-        for msg_file in msg_files:
-            try:
-                message = EmailMessage(msg_file)
-                messages.append(message)
-            except Exception as e:
-                self.logger.error(f"Failed to parse {msg_file}: {e}")
-                continue
+        max_workers = min(self.max_workers, total)
+        if max_workers > 1 and total >= self.PARALLEL_MIN_FILES:
+            # spawn: forking a process that runs other threads (GUI, web server) is unsafe
+            chunksize = max(1, total // (max_workers * 4))
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = executor.map(_parse_one, msg_files, chunksize=chunksize)
+                self._collect_parsed(msg_files, results, messages, progress_callback)
+        else:
+            results = (_parse_one(msg_file) for msg_file in msg_files)
+            self._collect_parsed(msg_files, results, messages, progress_callback)
         
         self.logger.info(f"Successfully parsed {len(messages)} messages")
         return messages
     
+    def _collect_parsed(self, msg_files: List[Path], results, messages: List[EmailMessage],
+                        progress_callback: Optional[Callable[[int, int], None]]):
+        """Append parsed messages in input order as results arrive, logging failures"""
+        for done, (msg_file, (message, error)) in enumerate(zip(msg_files, results), 1):
+            if message is None:
+                self.logger.error(f"Failed to parse {msg_file}: {error}")
+            else:
+                messages.append(message)
+            if progress_callback:
+                progress_callback(done, len(msg_files))
+    
     def parse_directory(self, directory: Path) -> List[EmailMessage]:
         """Parse all MSG files in a directory"""
-        msg_files = list(directory.glob("*.msg"))
+        msg_files = list(self._iter_msg_files(directory))
         
         if not msg_files:
             self.logger.warning(f"No .msg files found in {directory}")
             return []
         
         return self.parse_files(msg_files)
+    
+    def _iter_msg_files(self, directory: Path) -> Iterator[Path]:
+        """Yield *.msg files (any case) in a directory (one scandir pass, no per-entry stat on Linux)"""
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith('.msg') and not entry.name.startswith('.') and entry.is_file():
+                    yield Path(entry.path)
 
 
 if __name__ == "__main__":
@@ -3,13 +3,96 @@ Thread Builder - Reconstruct email conversation threads
 Groups related emails based on subject, participants, and timing
 """
 
+import bisect
+import hashlib
+import math
+import random
 import re
 import logging
-from typing import List, Dict, Set
-from datetime import timedelta
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import List, Dict, FrozenSet, Iterator, Optional, Set, Tuple
+from datetime import datetime, timedelta
 from src.parsers.msg_parser import EmailMessage
 
 
+# Sort key for undated messages (they sort first)
+_DATETIME_MIN = datetime.min
+
+# One reply/forward prefix (RE:, FW:, FWD:, AW:, [tag]) with trailing spaces
+_SUBJECT_PREFIX_RE = re.compile(r'^(?:re|fw|fwd|aw)\s*:\s*|^\[[^\]]*\]\s*', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# MinHash over subject character 3-grams, for near-duplicate subject grouping.
+# Fixed seed: signatures (and so groupings) are identical across runs
+_SHINGLE_SIZE = 3
+_MINHASH_PERMUTATIONS = 64
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(0x5EED)
+_MINHASH_PARAMS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(_MINHASH_PRIME))
+    for _ in range(_MINHASH_PERMUTATIONS)
+]
+
+
+@lru_cache(maxsize=8192)
+def _normalized_subject(subject: str) -> str:
+    """Normalized subject; memoized, since replies repeat the same subjects"""
+    if not subject:
+        return ""
+    
+    # Convert to lowercase
+    subject = subject.lower()
+    
+    # Remove stacked prefixes ("Re: Fw: [ext] ...") one at a time
+    while True:
+        subject, removed = _SUBJECT_PREFIX_RE.subn('', subject, count=1)
+        if not removed:
+            break
+    
+    # Remove extra whitespace
+    return _WHITESPACE_RE.sub(' ', subject).strip()
+
+
+def _find_splits(dates: List[Optional[datetime]], max_gap: timedelta) -> List[int]:
+    """Indices where both neighbouring dates are set and further apart than max_gap"""
+    return [
+        i for i, (previous, current) in enumerate(zip(dates, dates[1:]), 1)
+        if previous and current and current - previous > max_gap
+    ]
+
+
+@lru_cache(maxsize=8192)
+def _subject_signature(subject: str) -> Tuple[FrozenSet[str], Tuple[int, ...]]:
+    """Character shingles of a normalized subject and their MinHash signature"""
+    if len(subject) <= _SHINGLE_SIZE:
+        shingles = frozenset((subject,)) if subject else frozenset()
+    else:
+        shingles = frozenset(subject[i:i + _SHINGLE_SIZE] for i in range(len(subject) - _SHINGLE_SIZE + 1))
+    if not shingles:
+        return shingles, ()
+    
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for shingle in shingles
+    ]
+    signature = tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PARAMS)
+    return shingles, signature
+
+
+def _lsh_band_rows(threshold: float) -> int:
+    """
+    Rows per LSH band: the largest band size whose candidate threshold
+    (1/bands)^(1/rows) stays at or below threshold, so similar pairs still collide
+    """
+    rows = 1
+    for candidate in range(1, _MINHASH_PERMUTATIONS + 1):
+        bands, remainder = divmod(_MINHASH_PERMUTATIONS, candidate)
+        if not remainder and (1 / bands) ** (1 / candidate) <= threshold:
+            rows = candidate
+    return rows
+
+
 class EmailThread:
     """Represents a conversation thread"""
     
@@ -22,39 +105,59 @@ class EmailThread:
         self.end_date = None
         self.has_attachments = False
         self.total_attachments = 0
+        # Sort keys parallel to self.messages (undated messages sort first)
+        self._sort_keys = []
     
-    def add_message(self, message: EmailMessage):
-        """Add a message to this thread"""
-        self.messages.append(message)
-        self._update_metadata()
-    
-    def _update_metadata(self):
-        """Update thread metadata based on messages"""
-        if not self.messages:
-            return
+    @classmethod
+    def from_messages(cls, thread_id: str, messages: List[EmailMessage]) -> 'EmailThread':
+        """Build a thread from a complete message list: one sort and one aggregation pass"""
+        thread = cls(thread_id)
+        if not messages:
+            return thread
         
-        # Sort by date
-        self.messages.sort(key=lambda m: m.date if m.date else datetime.min)
+        thread.messages = sorted(messages, key=lambda m: m.date or _DATETIME_MIN)
+        thread._sort_keys = [m.date or _DATETIME_MIN for m in thread.messages]
+        thread.subject = thread.messages[0].subject
+        
+        dates = []
+        for msg in thread.messages:
+            thread.participants.add(msg.sender)
+            thread.participants.update(msg.recipients)
+            thread.participants.update(msg.cc)
+            if msg.date:
+                dates.append(msg.date)
+            thread.has_attachments = thread.has_attachments or msg.has_attachments
+            thread.total_attachments += msg.attachment_count
         
-        # Update subject (use first message subject)
+        if dates:
+            thread.start_date = min(dates)
+            thread.end_date = max(dates)
+        
+        return thread
+    
+    def add_message(self, message: EmailMessage):
+        """Add a message to this thread, keeping messages sorted by date and metadata current"""
+        # After equal dates, like a stable sort of the appended list
+        key = message.date or _DATETIME_MIN
+        idx = bisect.bisect_right(self._sort_keys, key)
+        self._sort_keys.insert(idx, key)
+        self.messages.insert(idx, message)
+        
+        # Subject of the earliest message
         self.subject = self.messages[0].subject
         
-        # Collect all participants
-        self.participants = set()
-        for msg in self.messages:
-            self.participants.add(msg.sender)
-            self.participants.update(msg.recipients)
-            self.participants.update(msg.cc)
+        self.participants.add(message.sender)
+        self.participants.update(message.recipients)
+        self.participants.update(message.cc)
         
-        # Update dates
-        dates = [m.date for m in self.messages if m.date]
-        if dates:
-            self.start_date = min(dates)
-            self.end_date = max(dates)
+        if message.date:
+            if self.start_date is None or message.date < self.start_date:
+                self.start_date = message.date
+            if self.end_date is None or message.date > self.end_date:
+                self.end_date = message.date
         
-        # Update attachment info
-        self.has_attachments = any(m.has_attachments for m in self.messages)
-        self.total_attachments = sum(m.attachment_count for m in self.messages)
+        self.has_attachments = self.has_attachments or message.has_attachments
+        self.total_attachments += message.attachment_count
     
     @property
     def message_count(self):
@@ -75,6 +178,8 @@ class ThreadBuilder:
         # Get settings from config
         thread_config = self.config.get('email', {}).get('thread_grouping', {})
         self.similarity_threshold = thread_config.get('similarity_threshold', 0.7)
+        # Jaccard similarity of subject 3-grams above which subject groups merge (0 = exact match only)
+        self.subject_similarity = thread_config.get('subject_similarity', 0)
         self.max_gap_days = thread_config.get('max_gap_days', 7)
     
     def build_threads(self, messages: List[EmailMessage]) -> List[EmailThread]:
@@ -92,65 +197,89 @@ class ThreadBuilder:
         if not messages:
             return []
         
-        # Group messages by normalized subject
-        subject_groups = self._group_by_subject(messages)
-        
         # Create threads
         threads = []
-        thread_counter = 1
-        
-        for subject_key, msgs in subject_groups.items():
-            # Split by participant overlap and time gaps
-            participant_groups = self._split_by_participants(msgs)
-            sub_threads = []
-            for participant_group in participant_groups:
-                sub_threads.extend(self._split_by_time_gap(participant_group, max_gap_days=self.max_gap_days))
-            
-            for sub_msgs in sub_threads:
-                thread = EmailThread(f"THREAD_{thread_counter:03d}")
-                for msg in sub_msgs:
-                    thread.add_message(msg)
-                threads.append(thread)
-                thread_counter += 1
+        for thread_counter, sub_msgs in enumerate(self._iter_sub_threads(messages), 1):
+            threads.append(EmailThread.from_messages(f"THREAD_{thread_counter:03d}", sub_msgs))
         
         self.logger.info(f"Created {len(threads)} threads")
         
         return threads
     
+    def _iter_sub_threads(self, messages: List[EmailMessage]) -> Iterator[List[EmailMessage]]:
+        """
+        Yield final thread message lists: per subject group, split by participant
+        overlap and then by time gaps, one subject group at a time
+        """
+        # Participant sets computed once per message (messages are slotted, so kept alongside by id)
+        participants_by_msg = {
+            id(msg): frozenset((msg.sender, *msg.recipients, *msg.cc)) for msg in messages
+        }
+        
+        for msgs in self._group_by_subject(messages).values():
+            for participant_group in self._split_by_participants(msgs, participants_by_msg):
+                yield from self._split_by_time_gap(participant_group, max_gap_days=self.max_gap_days)
+    
     def _group_by_subject(self, messages: List[EmailMessage]) -> Dict[str, List[EmailMessage]]:
         """Group messages by normalized subject"""
-        groups = {}
+        groups = defaultdict(list)
         
         for msg in messages:
-            normalized_subject = self._normalize_subject(msg.subject)
-            
-            if normalized_subject not in groups:
-                groups[normalized_subject] = []
-            
-            groups[normalized_subject].append(msg)
+            groups[self._normalize_subject(msg.subject)].append(msg)
+        
+        if self.subject_similarity > 0 and len(groups) > 1:
+            return self._merge_similar_subjects(groups)
         
         return groups
     
-    def _normalize_subject(self, subject: str) -> str:
+    def _merge_similar_subjects(self, groups: Dict[str, List[EmailMessage]]) -> Dict[str, List[EmailMessage]]:
         """
-        Normalize email subject for comparison
-        Remove RE:, FW:, etc. and extra whitespace
+        Merge subject groups whose subjects are near-duplicates. MinHash LSH
+        buckets yield candidate pairs, which are confirmed by exact Jaccard
+        similarity and joined with union-find; merged groups keep the key
+        of their first-seen subject.
         """
-        if not subject:
-            return ""
+        subjects = list(groups)
+        parent = list(range(len(subjects)))
+        
+        def find(idx: int) -> int:
+            while parent[idx] != idx:
+                parent[idx] = parent[parent[idx]]
+                idx = parent[idx]
+            return idx
         
-        # Convert to lowercase
-        subject = subject.lower()
+        rows = _lsh_band_rows(self.subject_similarity)
+        buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        shingles_by_idx = []
         
-        # Remove common prefixes
-        prefixes = [r'^re:', r'^fw:', r'^fwd:', r'^aw:', r'^\[.*?\]']
-        for prefix in prefixes:
-            subject = re.sub(prefix, '', subject, flags=re.IGNORECASE)
+        for idx, subject in enumerate(subjects):
+            shingles, signature = _subject_signature(subject)
+            shingles_by_idx.append(shingles)
+            
+            for start in range(0, len(signature), rows):
+                bucket = buckets.setdefault((start, signature[start:start + rows]), [])
+                for other in bucket:
+                    root, other_root = find(idx), find(other)
+                    if root == other_root:
+                        continue
+                    other_shingles = shingles_by_idx[other]
+                    similarity = len(shingles & other_shingles) / len(shingles | other_shingles)
+                    if similarity >= self.subject_similarity:
+                        parent[max(root, other_root)] = min(root, other_root)
+                bucket.append(idx)
         
-        # Remove extra whitespace
-        subject = ' '.join(subject.split())
+        merged: Dict[str, List[EmailMessage]] = {}
+        for idx, subject in enumerate(subjects):
+            merged.setdefault(subjects[find(idx)], []).extend(groups[subject])
         
-        return subject.strip()
+        return merged
+    
+    def _normalize_subject(self, subject: str) -> str:
+        """
+        Normalize email subject for comparison
+        Remove RE:, FW:, etc. and extra whitespace
+        """
+        return _normalized_subject(subject)
     
     def _split_by_time_gap(self, messages: List[EmailMessage], max_gap_days: int = 7) -> List[List[EmailMessage]]:
         """
@@ -167,68 +296,69 @@ class ThreadBuilder:
             return [messages]
         
         # Sort by date
-        sorted_messages = sorted(messages, key=lambda m: m.date if m.date else datetime.min)
-        
-        # Split if time gap is too large
-        sub_threads = []
-        current_thread = [sorted_messages[0]]
+        sorted_messages = sorted(messages, key=lambda m: m.date or _DATETIME_MIN)
         
-        for i in range(1, len(sorted_messages)):
-            current_msg = sorted_messages[i]
-            previous_msg = sorted_messages[i-1]
-            
-            # Check time gap
-            if current_msg.date and previous_msg.date:
-                time_gap = current_msg.date - previous_msg.date
-                
-                if time_gap > timedelta(days=max_gap_days):
-                    # Start new sub-thread
-                    sub_threads.append(current_thread)
-                    current_thread = [current_msg]
-                else:
-                    current_thread.append(current_msg)
-            else:
-                current_thread.append(current_msg)
+        split_indices = _find_splits([m.date for m in sorted_messages], timedelta(days=max_gap_days))
         
-        # Add last sub-thread
-        if current_thread:
-            sub_threads.append(current_thread)
+        bounds = zip([0, *split_indices], [*split_indices, len(sorted_messages)])
+        sub_threads = [sorted_messages[start:end] for start, end in bounds]
         
         return sub_threads if sub_threads else [messages]
 
-    def _split_by_participants(self, messages: List[EmailMessage]) -> List[List[EmailMessage]]:
+    def _split_by_participants(self, messages: List[EmailMessage],
+                               participants_by_msg: Dict[int, FrozenSet[str]] = None) -> List[List[EmailMessage]]:
         """
         Split by participant overlap to reduce false merges when subject is generic.
+        participants_by_msg optionally maps id(msg) to its precomputed participant set.
         """
         if len(messages) <= 1:
             return [messages]
 
         groups: List[List[EmailMessage]] = []
         group_participants: List[Set[str]] = []
+        # Inverted index: participant -> ids of groups containing them. Each group
+        # is listed once per participant, so counting hits gives the exact overlap
+        participant_groups: Dict[str, List[int]] = {}
 
         for msg in messages:
-            msg_participants = {msg.sender, *msg.recipients, *msg.cc}
-            matched = False
-            for idx, participants in enumerate(group_participants):
-                if not participants:
-                    continue
-                overlap = len(msg_participants & participants)
-                ratio = overlap / max(len(msg_participants), 1)
-                if ratio >= self.similarity_threshold:
-                    groups[idx].append(msg)
-                    group_participants[idx].update(msg_participants)
-                    matched = True
-                    break
-
-            if not matched:
-                groups.append([msg])
-                group_participants.append(set(msg_participants))
+            msg_participants = participants_by_msg.get(id(msg)) if participants_by_msg else None
+            if msg_participants is None:
+                msg_participants = frozenset((msg.sender, *msg.recipients, *msg.cc))
 
-        return groups
+            # The earliest created group over the threshold wins, as in a full scan
+            needed = self._required_overlap(len(msg_participants))
+            if needed <= 0:
+                # Zero overlap qualifies too: the first group always wins
+                target = 0 if groups else None
+            else:
+                shared = Counter(
+                    idx for participant in msg_participants
+                    for idx in participant_groups.get(participant, ())
+                )
+                target = min((idx for idx, count in shared.items() if count >= needed), default=None)
 
+            if target is None:
+                target = len(groups)
+                groups.append([])
+                group_participants.append(set())
+
+            groups[target].append(msg)
+            for participant in msg_participants - group_participants[target]:
+                participant_groups.setdefault(participant, []).append(target)
+            group_participants[target].update(msg_participants)
+
+        return groups
 
-# Import datetime for thread builder
-from datetime import datetime
+    def _required_overlap(self, participant_count: int) -> int:
+        """Smallest shared-participant count with count / participant_count >= similarity_threshold"""
+        total = max(participant_count, 1)
+        needed = max(math.ceil(self.similarity_threshold * total), 0)
+        # Settle float rounding against the exact ratio comparison
+        while needed > 0 and (needed - 1) / total >= self.similarity_threshold:
+            needed -= 1
+        while needed <= total and needed / total < self.similarity_threshold:
+            needed += 1
+        return needed
 
 
 if __name__ == "__main__":
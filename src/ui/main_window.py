@@ -5,9 +5,11 @@ Main application window with integrated screens
 import tkinter as tk
 from tkinter import ttk, messagebox
 import logging
+import queue
 from pathlib import Path
 from datetime import datetime
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 
 from src.ui.upload_screen import UploadScreen
 from src.ui.processing_screen import ProcessingScreen
@@ -25,6 +27,9 @@ from src.utils.api_client import ClaudeAPIClient
 class ReportMasterApp:
     """Main application class"""
     
+    # How often queued progress updates are applied to the UI
+    UI_DRAIN_INTERVAL_MS = 50
+    
     def __init__(self, config):
         self.config = config
         self.logger = logging.getLogger(__name__)
@@ -32,13 +37,16 @@ class ReportMasterApp:
         
         # Initialize processors
         self.api_client = ClaudeAPIClient(config)
-        self.parser = MSGParser()
+        self.parser = MSGParser(max_workers=config.get('email', {}).get('parsing', {}).get('workers', 1))
         self.thread_builder = ThreadBuilder(config)
         self.categorizer = Categorizer(config, self.api_client)
         self.summarizer = Summarizer(config, self.api_client)
         self.word_generator = WordReportGenerator(config)
         self.attachment_manager = AttachmentManager(config)
         
+        # Progress and outcome events from the processing thread, applied by _drain_ui_updates
+        self._ui_queue = queue.Queue()
+        
     def run(self):
         """Run the application"""
         self.logger.info("Initializing GUI")
@@ -88,6 +96,9 @@ class ReportMasterApp:
         """Start processing files in background thread"""
         self.show_processing_screen()
         
+        # Apply queued updates in periodic batches until the run reports its outcome
+        self.root.after(self.UI_DRAIN_INTERVAL_MS, self._drain_ui_updates)
+        
         # Run in separate thread to keep UI responsive
         thread = Thread(target=self._process_files, args=(file_paths,))
         thread.daemon = True
@@ -98,7 +109,10 @@ class ReportMasterApp:
         try:
             # Step 1: Parse emails
             self._update_step('step1', 'processing', 'Parsing email files...')
-            messages = self.parser.parse_files([Path(f) for f in file_paths])
+            messages = self.parser.parse_files(
+                [Path(f) for f in file_paths],
+                progress_callback=lambda done, total: self._update_progress(16 * done // total)
+            )
             self._update_step('step1', 'complete', f'Parsed {len(messages)} messages')
             self._update_progress(16)
             
@@ -110,36 +124,50 @@ class ReportMasterApp:
             
             # Step 3: Categorize
             self._update_step('step3', 'processing', 'AI Categorization in progress...')
-            categories = self.categorizer.categorize_threads(threads)
+            categories = self.categorizer.categorize_threads(
+                threads,
+                progress_callback=lambda done, total: self._update_progress(32 + 18 * done // total)
+            )
             self._update_step('step3', 'complete', f'Created {len(categories)} categories')
             self._update_progress(50)
             
-            # Step 4: Summarize
-            self._update_step('step4', 'processing', 'Generating AI summaries...')
-            summaries = self.summarizer.summarize_categories(categories)
-            self._update_step('step4', 'complete', f'Generated {len(summaries)} summaries')
-            self._update_progress(66)
-            
-            # Step 5: Generate Word document
-            self._update_step('step5', 'processing', 'Creating Word document...')
             output_dir = Path(self.config['paths']['output'])
-            report_month = datetime.now().strftime("%B %Y")
-            report_filename = f"Monthly_Report_{datetime.now().strftime('%Y_%m_%d_%H%M')}.docx"
-            report_path = output_dir / report_filename
             
-            self.word_generator.generate_report(
-                summaries=summaries,
-                output_path=report_path,
-                report_month=report_month
-            )
-            self._update_step('step5', 'complete', 'Report created')
-            self._update_progress(83)
-            
-            # Step 6: Save attachments
-            self._update_step('step6', 'processing', 'Organizing attachments...')
-            att_stats = self.attachment_manager.save_attachments(categories, output_dir)
-            self._update_step('step6', 'complete', f"Saved {att_stats['total_attachments']} attachments")
-            self._update_progress(100)
+            # Attachments only depend on the categories: write them to disk
+            # while summarization waits on the API
+            with ThreadPoolExecutor(max_workers=1) as attachment_executor:
+                attachments_future = attachment_executor.submit(
+                    self.attachment_manager.save_attachments, categories, output_dir
+                )
+                
+                # Step 4: Summarize
+                self._update_step('step4', 'processing', 'Generating AI summaries...')
+                summaries = self.summarizer.summarize_categories(
+                    categories,
+                    progress_callback=lambda done, total: self._update_progress(50 + 16 * done // total)
+                )
+                self._update_step('step4', 'complete', f'Generated {len(summaries)} summaries')
+                self._update_progress(66)
+                
+                # Step 5: Generate Word document
+                self._update_step('step5', 'processing', 'Creating Word document...')
+                report_month = datetime.now().strftime("%B %Y")
+                report_filename = f"Monthly_Report_{datetime.now().strftime('%Y_%m_%d_%H%M')}.docx"
+                report_path = output_dir / report_filename
+                
+                self.word_generator.generate_report(
+                    summaries=summaries,
+                    output_path=report_path,
+                    report_month=report_month
+                )
+                self._update_step('step5', 'complete', 'Report created')
+                self._update_progress(83)
+                
+                # Step 6: Save attachments
+                self._update_step('step6', 'processing', 'Organizing attachments...')
+                att_stats = attachments_future.result()
+                self._update_step('step6', 'complete', f"Saved {att_stats['total_attachments']} attachments")
+                self._update_progress(100)
             
             # Prepare results
             stats = {
@@ -152,20 +180,56 @@ class ReportMasterApp:
             
             attachments_path = output_dir / "Attachments"
             
-            # Show results screen
-            self.root.after(500, lambda: self._show_results(report_path, attachments_path, stats))
+            # Show results screen (queued behind the progress updates above)
+            self._ui_queue.put(('results', report_path, attachments_path, stats))
             
         except Exception as e:
             self.logger.error(f"Processing error: {e}", exc_info=True)
-            self.root.after(0, lambda: self._show_error(str(e)))
+            self._ui_queue.put(('error', str(e)))
     
     def _update_step(self, step_key, status, message):
         """Update processing step (thread-safe)"""
-        self.root.after(0, lambda: self.processing_screen.update_step(step_key, status, message))
+        self._ui_queue.put(('step', step_key, status, message))
     
     def _update_progress(self, percent):
         """Update progress bar (thread-safe)"""
-        self.root.after(0, lambda: self.processing_screen.update_progress(percent))
+        self._ui_queue.put(('progress', percent))
+    
+    def _drain_ui_updates(self):
+        """
+        Apply queued updates on the Tk thread: only the latest state of each
+        step and the last progress value are drawn per tick, however many
+        events the processing thread produced. The results or error event ends
+        the run: it is handled after the updates queued before it, and draining
+        stops until the next run.
+        """
+        steps = {}
+        percent = None
+        outcome = None
+        while outcome is None:
+            try:
+                event = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == 'step':
+                steps[event[1]] = event[2:]
+            elif event[0] == 'progress':
+                percent = event[1]
+            else:
+                outcome = event
+        
+        for step_key, (status, message) in steps.items():
+            self.processing_screen.update_step(step_key, status, message)
+        if percent is not None:
+            self.processing_screen.update_progress(percent)
+        
+        if outcome is None:
+            self.root.after(self.UI_DRAIN_INTERVAL_MS, self._drain_ui_updates)
+        elif outcome[0] == 'results':
+            # Leave the completed steps on screen for a moment
+            self.root.after(500, self._show_results, *outcome[1:])
+        else:
+            self._show_error(outcome[1])
     
     def _show_results(self, report_path, attachments_path, stats):
         """Show results screen"""
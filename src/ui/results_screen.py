@@ -6,6 +6,7 @@ Shows completion and report details
 import tkinter as tk
 from tkinter import ttk, messagebox
 import logging
+import os
 import subprocess
 import platform
 from pathlib import Path
@@ -142,12 +143,13 @@ Statistics:
         """Open file or folder with default application"""
         system = platform.system()
         
-        if system == "Darwin":  # macOS
-            subprocess.run(["open", str(path)])
-        elif system == "Windows":
-            subprocess.run(["start", str(path)], shell=True)
+        if system == "Windows":
+            # ShellExecute directly: no cmd.exe, no shell quoting of the path
+            os.startfile(str(path))
+        elif system == "Darwin":  # macOS
+            subprocess.Popen(["open", str(path)], start_new_session=True)
         else:  # Linux
-            subprocess.run(["xdg-open", str(path)])
+            subprocess.Popen(["xdg-open", str(path)], start_new_session=True)
     
     def _new_report(self):
         """Start creating a new report"""
@@ -6,16 +6,26 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
 import logging
+import os
+from threading import Thread
 
 
 class UploadScreen(ttk.Frame):
     """Screen for uploading .msg files"""
     
+    # Rows shown in the file list; beyond this a single "... and N more" row is shown
+    MAX_LISTED_FILES = 2000
+    # Paths passed from the folder scan to the UI thread at a time
+    SCAN_BATCH_SIZE = 256
+    
     def __init__(self, parent, app):
         super().__init__(parent)
         self.app = app
         self.logger = logging.getLogger(__name__)
         self.selected_files = []
+        # Normalized paths of selected_files, for O(1) duplicate checks
+        self._selected_set = set()
+        self._listed_count = 0
         
         self._create_widgets()
     
@@ -110,26 +120,75 @@ class UploadScreen(ttk.Frame):
         folder = filedialog.askdirectory(title="Select Folder")
         
         if folder:
-            folder_path = Path(folder)
-            msg_files = list(folder_path.glob("*.msg"))
-            
-            if msg_files:
-                self._add_files([str(f) for f in msg_files])
-            else:
-                messagebox.showwarning("No Files", f"No .msg files found in {folder}")
+            # Scan in the background; found files reach the list in batches
+            Thread(target=self._scan_folder, args=(folder,), daemon=True).start()
+    
+    def _scan_folder(self, folder: str):
+        """Walk folder recursively (worker thread) and hand .msg paths to the UI thread in batches"""
+        batch = []
+        found = 0
+        for path in self._iter_msg_files(folder):
+            batch.append(path)
+            if len(batch) >= self.SCAN_BATCH_SIZE:
+                self.after(0, self._add_files, batch)
+                found += len(batch)
+                batch = []
+        
+        if batch:
+            self.after(0, self._add_files, batch)
+            found += len(batch)
+        if not found:
+            self.after(0, messagebox.showwarning, "No Files", f"No .msg files found in {folder}")
+    
+    def _iter_msg_files(self, directory: str):
+        """Yield .msg file paths under directory, subfolders included (symlinked folders are not followed)"""
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            self.logger.warning(f"Skipping unreadable folder {directory}: {e}")
+            return
+        
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self._iter_msg_files(entry.path)
+                elif entry.name.lower().endswith('.msg') and entry.is_file():
+                    yield entry.path
     
     def _add_files(self, files):
         """Add files to the list"""
+        new_files = []
         for file in files:
-            if file not in self.selected_files:
-                self.selected_files.append(file)
-                self.file_listbox.insert(tk.END, Path(file).name)
+            # The file dialog and folder scan can spell the same path differently
+            # (separators, case on Windows), so compare normalized paths
+            key = os.path.normcase(os.path.abspath(file))
+            if key not in self._selected_set:
+                self._selected_set.add(key)
+                new_files.append(file)
+        self.selected_files.extend(new_files)
+        
+        # One Listbox insert call for all new rows, capped at MAX_LISTED_FILES
+        room = self.MAX_LISTED_FILES - self._listed_count
+        if room > 0 and new_files:
+            names = [Path(file).name for file in new_files[:room]]
+            self.file_listbox.insert(tk.END, *names)
+            self._listed_count += len(names)
+        
+        hidden = len(self.selected_files) - self._listed_count
+        if self.file_listbox.size() > self._listed_count:
+            self.file_listbox.delete(tk.END)
+        if hidden > 0:
+            self.file_listbox.insert(tk.END, f"... and {hidden} more")
         
         self._update_ui()
     
     def _clear_files(self):
         """Clear all selected files"""
         self.selected_files.clear()
+        self._selected_set.clear()
+        self._listed_count = 0
         self.file_listbox.delete(0, tk.END)
         self._update_ui()
     
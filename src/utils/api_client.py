@@ -2,15 +2,233 @@
 GigaChat API Client for categorization and summarization.
 """
 
+import hashlib
+import importlib.util
 import json
 import logging
+import os
+import random
 import re
+import threading
 import time
-from typing import Dict, List, Optional
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 from uuid import uuid4
 
 import httpx
 
+try:
+    import fcntl
+except ImportError:  # Windows: token file writes stay atomic, just unlocked
+    fcntl = None
+
+from src.utils.result_cache import ResultCache
+from src.utils.semantic_cache import SemanticCache
+
+
+# Static instruction blocks are sent as the system message so that the shared
+# prefix of every request is identical and can be served from the provider's
+# context cache; only per-thread data goes into the user message.
+_CATEGORIZE_SYSTEM_PROMPT = """Проанализируй email переписку и предоставь НА РУССКОМ ЯЗЫКЕ:
+1. Краткое название категории (2-4 слова) в формате работы с консультантом или оператором
+2. Краткое описание контекста (1 предложение)
+
+Ответь в точном формате:
+Категория: [название категории]
+Описание: [описание контекста]"""
+
+_CATEGORIZE_BATCH_SYSTEM_PROMPT = """Проанализируй каждую из переданных email переписок и предоставь для каждой НА РУССКОМ ЯЗЫКЕ:
+1. Краткое название категории (2-4 слова) в формате работы с консультантом или оператором
+2. Краткое описание контекста (1 предложение)
+
+Верни результат СТРОГО в формате JSON-массива, по одному объекту на каждую переписку (i — номер переписки):
+[
+  {"i": 1, "category": "...", "description": "..."},
+  {"i": 2, "category": "...", "description": "..."}
+]"""
+
+_SUMMARIZE_SYSTEM_PROMPT = """Ты — профессиональный AI-аналитик и автор ежемесячных проектных отчётов в девелопменте и гостиничном строительстве.
+
+Создай структурированный отчёт по разделу **4. Работа с консультантами и операторами** на основе переписки.
+
+**ВАЖНО:** Отчёт должен быть в деловом, нейтральном стиле, совершенный вид, 3-е лицо.
+**КРИТИЧЕСКОЕ ПРАВИЛО:** НЕ указывай ФИО, имена и должности конкретных людей.
+Во всех формулировках используй только названия организаций (по доменам email и контексту переписки).
+Пример: вместо "Юдина Т.В. инициировала..." пиши "Спектрум Холдинг инициировало...".
+Если персоналия встречается в тексте, замени её на соответствующую организацию.
+
+Создай отчёт в следующем формате (каждый раздел должен быть заполнен):
+
+**Контекст:** [Одно предложение — цель или фон работ]
+
+**Действия:**
+[Пронумерованный список конкретных действий: кто, что сделал, какие документы направлены]
+
+**Результат / Статус:**
+[Краткое резюме текущего статуса: согласовано / не согласовано / с комментариями / требует доработки]
+
+**Стороны / Контрагенты:**
+[Перечисли ключевых участников: архитекторы, консультанты, подрядчики, операторы]
+
+**Замечания / Риски:**
+[Фактические замечания без эмоций, если есть проблемы или риски]
+
+**Рекомендации / Следующие шаги:**
+[Конкретные рекомендации в формате: "СХ рекомендует..." или "Рекомендуется..."]
+
+Верни результат СТРОГО в формате JSON:
+{
+  "context": "...",
+  "actions": ["1. ...", "2. ...", "3. ..."],
+  "result": "...",
+  "parties": "...",
+  "remarks": "...",
+  "recommendations": "..."
+}"""
+
+# Changes whenever a categorization prompt is edited; part of the categorizer's cache keys
+CATEGORIZE_PROMPT_TAG = hashlib.sha256(
+    (_CATEGORIZE_SYSTEM_PROMPT + _CATEGORIZE_BATCH_SYSTEM_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+# "Категория: ..." / "Описание: ..." lines of a single-thread categorization answer
+_CATEGORY_LINE_RE = re.compile(r"^(?:Категория|Category):(?P<value>.*)$", re.MULTILINE)
+_DESCRIPTION_LINE_RE = re.compile(r"^(?:Описание|Description):(?P<value>.*)$", re.MULTILINE)
+
+_EMAIL_DOMAIN_RE = re.compile(r"[A-Za-z0-9._%+-]+@([A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+
+_DOMAIN_ALIASES = {
+    "spgr.ru": "Спектрум Холдинг",
+    "dusit.com": "Dusit International",
+    "port-gdz.com": "Порт Геленджик",
+    "dyergroup.ru": "Dyer Group",
+    "groupdyer.com": "Dyer Group",
+    "gmail.com": "Внешний контрагент",
+    "yandex.ru": "Внешний контрагент",
+    "mail.ru": "Внешний контрагент",
+}
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extract_json(content: str, opener: str):
+    """
+    First JSON value starting with opener ("{" or "[") embedded in model output,
+    or None. Decodes in one linear pass from each candidate position instead of
+    regex-matching the span and parsing it again.
+    """
+    start = content.find(opener)
+    while start != -1:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(content, start)
+            return value
+        except ValueError:
+            start = content.find(opener, start + 1)
+    return None
+
+
+# httpx clients shared by every API client in the process (the pipeline builds a
+# client per run or web job), keyed by their connection settings, each with the
+# semaphore capping completions in flight through it
+_HTTP_CLIENTS: Dict[Tuple[bool, bool, int], Tuple[httpx.Client, threading.BoundedSemaphore]] = {}
+_HTTP_CLIENTS_LOCK = threading.Lock()
+
+
+def _shared_http_client(verify_ssl: bool, http2: bool,
+                        max_concurrency: int) -> Tuple[httpx.Client, threading.BoundedSemaphore]:
+    """
+    Process-wide httpx client for these settings and the semaphore that keeps
+    completions through it within max_concurrency, across all API clients
+    """
+    # Multiplex requests over one TLS connection per host when h2 is installed
+    http2 = http2 and importlib.util.find_spec("h2") is not None
+    key = (verify_ssl, http2, max_concurrency)
+    with _HTTP_CLIENTS_LOCK:
+        client, request_slots = _HTTP_CLIENTS.get(key, (None, None))
+        if client is None or client.is_closed:
+            client = httpx.Client(
+                timeout=httpx.Timeout(45.0, connect=5.0),
+                verify=verify_ssl,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=max_concurrency * 2,
+                    max_keepalive_connections=max_concurrency,
+                    keepalive_expiry=60.0,
+                ),
+            )
+            # A replaced (closed) client keeps its semaphore: slots still held
+            # by requests in flight keep counting against the same limit
+            if request_slots is None:
+                request_slots = threading.BoundedSemaphore(max_concurrency)
+            _HTTP_CLIENTS[key] = (client, request_slots)
+        return client, request_slots
+
+
+def _json_complete(content: str, opener: str) -> bool:
+    """
+    Whether content already holds the JSON value _extract_json would return:
+    bracket depth (outside strings) is tracked from each candidate opener, and a
+    balanced span is confirmed by decoding it. An unbalanced first candidate
+    means more output is needed.
+    """
+    closer = "}" if opener == "{" else "]"
+    start = content.find(opener)
+    while start != -1:
+        depth = 0
+        in_string = escaped = False
+        end = -1
+        for pos in range(start, len(content)):
+            char = content[pos]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    end = pos
+                    break
+        if end == -1:
+            return False
+        if content[end] == closer:
+            try:
+                _JSON_DECODER.raw_decode(content, start)
+                return True
+            except ValueError:
+                pass
+        start = content.find(opener, start + 1)
+    return False
+
+
+def _truncate_text(text: str, max_chars: int) -> str:
+    """
+    Cut text to at most max_chars, at the last whitespace when it falls in the
+    final fifth of the budget, so the model does not get a word split in half
+    """
+    if len(text) <= max_chars:
+        return text
+    boundary = max(text.rfind(" ", 0, max_chars + 1), text.rfind("\n", 0, max_chars + 1))
+    if boundary >= max_chars * 0.8:
+        return text[:boundary].rstrip()
+    return text[:max_chars]
+
+
+def _organization_for_domain(domain: str) -> str:
+    """Organization name for a lowercased email domain"""
+    org = _DOMAIN_ALIASES.get(domain)
+    if not org:
+        parts = domain.split(".")
+        org = parts[-2].upper() if len(parts) >= 2 else domain.upper()
+    return org
+
 
 class GigaChatAPIClient:
     """
@@ -21,6 +239,14 @@ class GigaChatAPIClient:
     OAUTH_URL = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
     API_URL = "https://gigachat.devices.sberbank.ru/api/v1/chat/completions"
 
+    # Backoff between retries of transient failures, in seconds
+    RETRY_BASE_DELAY = 1.0
+    RETRY_MAX_DELAY = 30.0
+    # Smallest summary generation budget; roughly six characters per token are added on top
+    SUMMARY_MIN_TOKENS = 600
+    # Average characters per token, for estimating usage the provider did not report
+    CHARS_PER_TOKEN = 4
+
     def __init__(self, config: dict):
         self.logger = logging.getLogger(__name__)
         self.config = config
@@ -34,14 +260,54 @@ class GigaChatAPIClient:
         self.max_tokens = api_cfg.get("max_tokens", 2048)
         self.temperature = api_cfg.get("temperature", 0.3)
 
+        self.session_id = str(uuid4())
+
         self._access_token: Optional[str] = None
         self._token_expires_at: int = 0
+        # OAuth token shared with other runs and processes through a per-key file
+        self.token_cache_path: Optional[Path] = None
+        if api_cfg.get("token_cache", True) and self.auth_key and self.auth_key != "not_set":
+            key_hash = hashlib.sha256(f"{self.auth_key}|{self.scope}".encode("utf-8")).hexdigest()[:16]
+            self.token_cache_path = Path.home() / ".cache" / "reportmaster" / f"gigachat_token_{key_hash}.json"
+        # Token refresh and usage accounting are shared by concurrent callers.
+        self._token_lock = threading.Lock()
+        self._usage_lock = threading.Lock()
         self._usage = {
             "prompt_tokens": 0,
             "completion_tokens": 0,
             "total_tokens": 0,
         }
-        self.http = httpx.Client(timeout=45.0, verify=self.verify_ssl)
+        # Callers run requests from worker threads: cap in-flight completions at
+        # the provider's concurrency limit and keep enough pooled connections alive.
+        # Both are process-wide, so concurrent jobs share one limit
+        self.max_concurrency = max(1, int(api_cfg.get("max_concurrency", 16)))
+        self.stream_json = bool(api_cfg.get("stream_json", False))
+        self.max_retries = max(0, int(api_cfg.get("max_retries", 4)))
+        self.http, self._request_slots = _shared_http_client(
+            verify_ssl=self.verify_ssl,
+            http2=bool(api_cfg.get("http2", True)),
+            max_concurrency=self.max_concurrency,
+        )
+
+        # Exact-match cache of completions keyed by model, sampling settings and
+        # prompt; persisted when a temp folder is configured
+        cache_cfg = api_cfg.get("response_cache", {})
+        self.cache_enabled = cache_cfg.get("enabled", True)
+        self.cache_ttl_seconds = float(cache_cfg.get("ttl_days", 30)) * 86400
+        cache_path = None
+        if self.cache_enabled and "temp" in config.get("paths", {}):
+            cache_path = Path(config["paths"]["temp"]) / ".reportmaster_cache.sqlite"
+        self.response_cache = ResultCache(cache_path, table="completions")
+
+        # Near-duplicate summaries: reuse a stored summary for a paraphrased thread
+        semantic_cfg = api_cfg.get("semantic_cache", {})
+        self.semantic_cache = None
+        if semantic_cfg.get("enabled", False):
+            self.semantic_cache = SemanticCache(
+                cache_path if self.cache_enabled else None,
+                threshold=float(semantic_cfg.get("threshold", 0.93)),
+                table="summaries",
+            )
 
         if not self.auth_key or self.auth_key == "not_set":
             self.logger.warning("GigaChat authorization key not set!")
@@ -52,54 +318,108 @@ class GigaChatAPIClient:
 
     def categorize_thread(self, subject: str, keywords: List[str], sample_content: str) -> Dict:
         if not self.client:
-            return {
-                "category": subject[:50],
-                "description": "Категория определена по теме переписки",
-            }
-
-        prompt = f"""Проанализируй эту email переписку и предоставь НА РУССКОМ ЯЗЫКЕ:
-1. Краткое название категории (2-4 слова) в формате работы с консультантом или оператором
-2. Краткое описание контекста (1 предложение)
+            return self._fallback_category(subject)
 
-Тема: {subject}
+        prompt = f"""Тема: {subject}
 Ключевые слова: {', '.join(keywords[:10])}
 
 Пример содержания:
-{sample_content[:500]}
-
-Ответь в точном формате:
-Категория: [название категории]
-Описание: [описание контекста]"""
+{_truncate_text(sample_content, 500)}"""
 
         try:
-            content = self._chat_completion(
+            content = self._cached_completion(
                 prompt=prompt,
                 model=self.model_categorization,
                 max_tokens=200,
+                system=_CATEGORIZE_SYSTEM_PROMPT,
+                validate=_CATEGORY_LINE_RE.search,
             )
 
-            category = "Без категории"
-            description = ""
-
-            for line in content.split("\n"):
-                if line.startswith("Категория:") or line.startswith("Category:"):
-                    category = line.split(":", 1)[1].strip()
-                elif line.startswith("Описание:") or line.startswith("Description:"):
-                    description = line.split(":", 1)[1].strip()
+            category_match = _CATEGORY_LINE_RE.search(content)
+            description_match = _DESCRIPTION_LINE_RE.search(content)
 
             return {
-                "category": category,
-                "description": description,
+                "category": category_match.group("value").strip() if category_match else "Без категории",
+                "description": description_match.group("value").strip() if description_match else "",
             }
 
         except Exception as e:
             self.logger.error(f"Error categorizing thread: {e}")
             if self._is_auth_error(e):
                 self.client = None
-            return {
-                "category": subject[:50],
-                "description": "Категория определена по теме переписки",
-            }
+            return self._fallback_category(subject)
+
+    def _fallback_category(self, subject: str) -> Dict:
+        """Subject-based category used when the API is unavailable (marked so it is not cached)."""
+        return {
+            "category": subject[:50],
+            "description": "Категория определена по теме переписки",
+            "fallback": True,
+        }
+
+    def categorize_threads_batch(self, subjects: List[str], keywords_list: List[List[str]], samples_list: List[str]) -> List[Dict]:
+        """
+        Categorize several threads with a single request.
+
+        Returns one result dict per input thread, in input order. Threads the
+        model did not answer for are categorized one by one; when the request
+        itself fails (after its retries), every thread gets the subject-based
+        fallback instead of a request of its own.
+        """
+        if not self.client:
+            return [self.categorize_thread(s, k, c) for s, k, c in zip(subjects, keywords_list, samples_list)]
+
+        blocks = []
+        for idx, (subject, keywords, sample_content) in enumerate(zip(subjects, keywords_list, samples_list), 1):
+            blocks.append(
+                f"### Переписка {idx}\n"
+                f"Тема: {subject}\n"
+                f"Ключевые слова: {', '.join(keywords[:10])}\n"
+                f"Пример содержания:\n{_truncate_text(sample_content, 500)}"
+            )
+        prompt = "\n\n".join(blocks)
+
+        results: List[Optional[Dict]] = [None] * len(blocks)
+        try:
+            content = self._cached_completion(
+                prompt=prompt,
+                model=self.model_categorization,
+                max_tokens=200 * len(blocks),
+                system=_CATEGORIZE_BATCH_SYSTEM_PROMPT,
+                json_opener="[",
+            )
+
+            items = _extract_json(content, "[")
+            if not isinstance(items, list):
+                items = []
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                try:
+                    idx = int(item.get("i", 0)) - 1
+                except (TypeError, ValueError):
+                    continue
+                if 0 <= idx < len(results) and item.get("category"):
+                    results[idx] = {
+                        "category": str(item["category"]).strip(),
+                        "description": str(item.get("description", "")).strip(),
+                    }
+
+        except Exception as e:
+            self.logger.error(f"Error categorizing thread batch: {e}")
+            if self._is_auth_error(e):
+                self.client = None
+            # The provider is down or throttling: one request per thread would
+            # only multiply the load (and the retry waits) on it
+            return [self._fallback_category(subject) for subject in subjects]
+
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if missing and len(missing) < len(results):
+            self.logger.warning(f"Batch categorization returned no result for {len(missing)} threads, retrying one by one")
+        for idx in missing:
+            results[idx] = self.categorize_thread(subjects[idx], keywords_list[idx], samples_list[idx])
+
+        return results
 
     def summarize_thread(self, messages: List[str], participants: List[str], date_range: str, category: str, context: str) -> Dict:
         if not self.client:
@@ -112,21 +432,11 @@ class GigaChatAPIClient:
                 "recommendations": "",
             }
 
-        combined = "\n\n---\n\n".join(messages[:5])
+        combined = _truncate_text("\n\n---\n\n".join(messages[:5]), 2500)
         organizations = self._extract_organizations(participants)
         organizations_text = ", ".join(organizations) if organizations else "Организации не определены"
 
-        prompt = f"""Ты — профессиональный AI-аналитик и автор ежемесячных проектных отчётов в девелопменте и гостиничном строительстве.
-
-Создай структурированный отчёт по разделу **4. Работа с консультантами и операторами** на основе переписки.
-
-**ВАЖНО:** Отчёт должен быть в деловом, нейтральном стиле, совершенный вид, 3-е лицо.
-**КРИТИЧЕСКОЕ ПРАВИЛО:** НЕ указывай ФИО, имена и должности конкретных людей.
-Во всех формулировках используй только названия организаций (по доменам email и контексту переписки).
-Пример: вместо "Юдина Т.В. инициировала..." пиши "Спектрум Холдинг инициировало...".
-Если персоналия встречается в тексте, замени её на соответствующую организацию.
-
-**Входные данные:**
+        prompt = f"""**Входные данные:**
 - Тема: {category}
 - Контекст: {context}
 - Период: {date_range}
@@ -134,47 +444,34 @@ class GigaChatAPIClient:
 - Определённые организации: {organizations_text}
 
 Переписка:
-{combined[:2500]}
-
-Создай отчёт в следующем формате (каждый раздел должен быть заполнен):
-
-**Контекст:** [Одно предложение — цель или фон работ]
-
-**Действия:**
-[Пронумерованный список конкретных действий: кто, что сделал, какие документы направлены]
+{combined}"""
 
-**Результат / Статус:**
-[Краткое резюме текущего статуса: согласовано / не согласовано / с комментариями / требует доработки]
+        # The JSON layout is fixed, so the answer grows with the correspondence:
+        # short threads get a smaller generation budget
+        budget = min(self.max_tokens, self.SUMMARY_MIN_TOKENS + len(combined) // 6)
 
-**Стороны / Контрагенты:**
-[Перечисли ключевых участников: архитекторы, консультанты, подрядчики, операторы]
-
-**Замечания / Риски:**
-[Фактические замечания без эмоций, если есть проблемы или риски]
-
-**Рекомендации / Следующие шаги:**
-[Конкретные рекомендации в формате: "СХ рекомендует..." или "Рекомендуется..."]
-
-Верни результат СТРОГО в формате JSON:
-{{
-  "context": "...",
-  "actions": ["1. ...", "2. ...", "3. ..."],
-  "result": "...",
-  "parties": "...",
-  "remarks": "...",
-  "recommendations": "..."
-}}"""
+        # Period and organizations are part of the key, so summaries only carry
+        # over between threads that also match in these facts
+        semantic_key = f"{category}\n{context}\n{date_range}\n{organizations_text}\n{combined[:500]}"
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(semantic_key)
+            if cached is not None:
+                return dict(cached)
 
         try:
-            content = self._chat_completion(
+            content = self._cached_completion(
                 prompt=prompt,
                 model=self.model_summarization,
-                max_tokens=self.max_tokens,
+                max_tokens=budget,
+                system=_SUMMARIZE_SYSTEM_PROMPT,
+                json_opener="{",
             )
 
-            json_match = re.search(r"\{.*\}", content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(0))
+            summary = _extract_json(content, "{")
+            if summary is not None:
+                if self.semantic_cache is not None:
+                    self.semantic_cache.set(semantic_key, summary)
+                return summary
 
             return {
                 "context": context,
@@ -199,10 +496,29 @@ class GigaChatAPIClient:
             }
 
     def _get_access_token(self) -> str:
+        with self._token_lock:
+            return self._get_access_token_locked()
+
+    def _get_access_token_locked(self) -> str:
         now = int(time.time())
         if self._access_token and now < self._token_expires_at - 60:
             return self._access_token
 
+        # Another process may have refreshed the token already; the file lock
+        # lets only one of several starting workers call the OAuth endpoint
+        with self._token_file_lock():
+            cached = self._load_cached_token()
+            if cached and now < cached[1] - 60:
+                token, expires_at = cached
+            else:
+                token, expires_at = self._request_access_token(now)
+                self._store_cached_token(token, expires_at)
+
+        self._access_token = token
+        self._token_expires_at = expires_at
+        return token
+
+    def _request_access_token(self, now: int) -> Tuple[str, int]:
         headers = {
             "Accept": "application/json",
             "Content-Type": "application/x-www-form-urlencoded",
@@ -220,30 +536,162 @@ class GigaChatAPIClient:
         if not token:
             raise RuntimeError("GigaChat OAuth token was not returned")
 
+        # GigaChat reports expires_at in milliseconds.
+        if expires_at > 10 ** 11:
+            expires_at //= 1000
+
         # If expires_at wasn't provided, fall back to ~30 min.
         if expires_at <= now:
             expires_at = now + 29 * 60
 
-        self._access_token = token
-        self._token_expires_at = expires_at
-        return token
+        return token, expires_at
+
+    @contextmanager
+    def _token_file_lock(self):
+        if self.token_cache_path is None or fcntl is None:
+            yield
+            return
+
+        try:
+            self.token_cache_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+            lock_file = open(self.token_cache_path.with_suffix(".lock"), "a")
+        except OSError as e:
+            self.logger.debug("Token cache lock unavailable: %s", e)
+            yield
+            return
+
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_cached_token(self) -> Optional[Tuple[str, int]]:
+        if self.token_cache_path is None:
+            return None
+        try:
+            with open(self.token_cache_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            return str(payload["token"]), int(payload["expires_at"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.debug("Ignoring unreadable token cache: %s", e)
+            return None
+
+    def _store_cached_token(self, token: str, expires_at: int) -> None:
+        if self.token_cache_path is None:
+            return
+        tmp_path = self.token_cache_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            self.token_cache_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"token": token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, self.token_cache_path)
+        except OSError as e:
+            self.logger.warning("Could not persist GigaChat token: %s", e)
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+
+    def _cached_completion(self, prompt: str, model: str, max_tokens: int, system: Optional[str] = None,
+                           json_opener: Optional[str] = None,
+                           validate: Optional[Callable[[str], object]] = None) -> str:
+        """
+        _chat_completion behind the exact-match response cache. json_opener ("{"
+        or "[") marks a JSON answer: with streaming enabled, generation is cut
+        off once that JSON value is complete. Only answers passing validate
+        (by default: a JSON answer must contain a decodable value) are cached.
+        """
+        if self.cache_enabled:
+            raw_key = json.dumps(
+                {"m": model, "t": self.temperature, "mt": max_tokens, "s": system, "p": prompt},
+                ensure_ascii=False,
+                sort_keys=True,
+            )
+            key = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+            cached = self.response_cache.get(key)
+            if cached is not None and time.time() - cached.get("created", 0) < self.cache_ttl_seconds:
+                return cached["content"]
+
+        if json_opener and self.stream_json:
+            content = self._with_retries(
+                lambda: self._stream_chat_completion(prompt, model, max_tokens, system, json_opener)
+            )
+        else:
+            content = self._with_retries(
+                lambda: self._chat_completion(prompt=prompt, model=model, max_tokens=max_tokens, system=system)
+            )
+
+        # A malformed or cut-off answer is returned once but not replayed on reruns
+        if validate is not None:
+            cacheable = bool(validate(content))
+        else:
+            cacheable = not json_opener or _extract_json(content, json_opener) is not None
+        if self.cache_enabled and cacheable:
+            self.response_cache.set(key, {"content": content, "created": time.time()})
+        return content
 
-    def _chat_completion(self, prompt: str, model: str, max_tokens: int) -> str:
+    def _with_retries(self, request: Callable[[], str]) -> str:
+        """
+        Run request, retrying rate limits (429), server errors (5xx) and transport
+        failures with jittered exponential backoff; Retry-After is honored when
+        the provider sends it. Other errors (auth included) propagate at once.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return request()
+            except (httpx.HTTPStatusError, httpx.TransportError) as e:
+                response = e.response if isinstance(e, httpx.HTTPStatusError) else None
+                if response is not None and response.status_code != 429 and response.status_code < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+
+                delay = min(self.RETRY_MAX_DELAY, self.RETRY_BASE_DELAY * 2 ** attempt)
+                delay += random.uniform(0, delay / 2)
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                if retry_after:
+                    try:
+                        delay = min(self.RETRY_MAX_DELAY, max(float(retry_after), 0.0))
+                    except ValueError:
+                        pass
+                reason = f"HTTP {response.status_code}" if response is not None else type(e).__name__
+                self.logger.warning(f"GigaChat request failed ({reason}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _completion_request(self, prompt: str, model: str, max_tokens: int,
+                            system: Optional[str], stream: bool) -> Tuple[Dict[str, str], Dict]:
         token = self._get_access_token()
         headers = {
-            "Accept": "application/json",
+            "Accept": "text/event-stream" if stream else "application/json",
             "Content-Type": "application/json",
             "Authorization": f"Bearer {token}",
+            # Requests sharing a session id reuse the cached system prefix.
+            "X-Session-ID": self.session_id,
         }
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
         payload = {
             "model": model,
-            "messages": [{"role": "user", "content": prompt}],
+            "messages": messages,
             "temperature": self.temperature,
             "max_tokens": max_tokens,
-            "stream": False,
+            "stream": stream,
         }
+        return headers, payload
 
-        response = self.http.post(self.API_URL, headers=headers, json=payload)
+    def _chat_completion(self, prompt: str, model: str, max_tokens: int, system: Optional[str] = None) -> str:
+        headers, payload = self._completion_request(prompt, model, max_tokens, system, stream=False)
+
+        with self._request_slots:
+            response = self.http.post(self.API_URL, headers=headers, json=payload)
         response.raise_for_status()
         body = response.json()
         self._accumulate_usage(body.get("usage") or {})
@@ -258,8 +706,57 @@ class GigaChatAPIClient:
             raise RuntimeError("GigaChat response message content is empty")
         return content
 
+    def _stream_chat_completion(self, prompt: str, model: str, max_tokens: int,
+                                system: Optional[str], json_opener: str) -> str:
+        """Streamed completion (SSE) that stops reading once the JSON answer is complete"""
+        headers, payload = self._completion_request(prompt, model, max_tokens, system, stream=True)
+        closer = "}" if json_opener == "{" else "]"
+        parts: List[str] = []
+        usage_reported = False
+
+        with self._request_slots:
+            with self.http.stream("POST", self.API_URL, headers=headers, json=payload) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        self._accumulate_usage(chunk["usage"])
+                        usage_reported = True
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = choices[0].get("delta", {}).get("content") or ""
+                    parts.append(delta)
+                    # Closing the connection early drops trailing commentary
+                    if closer in delta and _json_complete("".join(parts), json_opener):
+                        break
+
+        content = "".join(parts)
+        if not content:
+            raise RuntimeError("GigaChat response message content is empty")
+
+        # GigaChat sends usage only with the final chunk, which an early stop
+        # never reads: count an estimate from the text lengths instead, so job
+        # statistics do not drop to zero (tokens generated after the stop are missed)
+        if not usage_reported:
+            self._accumulate_usage({
+                "prompt_tokens": self._estimate_tokens((system or "") + prompt),
+                "completion_tokens": self._estimate_tokens(content),
+            })
+        return content
+
+    def _estimate_tokens(self, text: str) -> int:
+        return -(-len(text) // self.CHARS_PER_TOKEN)
+
     def get_usage_stats(self) -> Dict[str, int]:
-        return dict(self._usage)
+        with self._usage_lock:
+            return dict(self._usage)
 
     def _accumulate_usage(self, usage: Dict) -> None:
         try:
@@ -270,12 +767,13 @@ class GigaChatAPIClient:
             self.logger.warning("Could not parse token usage payload: %s", usage)
             return
 
-        self._usage["prompt_tokens"] += max(prompt_tokens, 0)
-        self._usage["completion_tokens"] += max(completion_tokens, 0)
-        if total_tokens > 0:
-            self._usage["total_tokens"] += total_tokens
-        else:
-            self._usage["total_tokens"] += max(prompt_tokens, 0) + max(completion_tokens, 0)
+        with self._usage_lock:
+            self._usage["prompt_tokens"] += max(prompt_tokens, 0)
+            self._usage["completion_tokens"] += max(completion_tokens, 0)
+            if total_tokens > 0:
+                self._usage["total_tokens"] += total_tokens
+            else:
+                self._usage["total_tokens"] += max(prompt_tokens, 0) + max(completion_tokens, 0)
 
     def _is_auth_error(self, error: Exception) -> bool:
         text = str(error).lower()
@@ -289,33 +787,13 @@ class GigaChatAPIClient:
         )
 
     def _extract_organizations(self, participants: List[str]) -> List[str]:
-        domain_aliases = {
-            "spgr.ru": "Спектрум Холдинг",
-            "dusit.com": "Dusit International",
-            "port-gdz.com": "Порт Геленджик",
-            "dyergroup.ru": "Dyer Group",
-            "groupdyer.com": "Dyer Group",
-            "gmail.com": "Внешний контрагент",
-            "yandex.ru": "Внешний контрагент",
-            "mail.ru": "Внешний контрагент",
-        }
-
-        orgs = []
-        seen = set()
-
-        for item in participants:
-            emails = re.findall(r"[A-Za-z0-9._%+-]+@([A-Za-z0-9.-]+\.[A-Za-z]{2,})", item or "")
-            for domain in emails:
-                domain = domain.lower()
-                org = domain_aliases.get(domain)
-                if not org:
-                    parts = domain.split(".")
-                    org = parts[-2].upper() if len(parts) >= 2 else domain.upper()
-                if org not in seen:
-                    seen.add(org)
-                    orgs.append(org)
-
-        return orgs
+        # dict keys keep first-seen order while dropping duplicates
+        orgs = dict.fromkeys(
+            _organization_for_domain(domain.lower())
+            for item in participants
+            for domain in _EMAIL_DOMAIN_RE.findall(item or "")
+        )
+        return list(orgs)
 
 
 ClaudeAPIClient = GigaChatAPIClient
@@ -4,27 +4,73 @@ Configuration loader
 
 import yaml
 import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict: every mutating method raises TypeError. Still a dict for
+    isinstance checks and json, and pickles (e.g. to worker processes) as a
+    FrozenDict again.
+    """
+    
+    __slots__ = ()
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
+    
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+    
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
 
 def load_config():
     """
-    Load application configuration from YAML and environment variables
+    Load application configuration from YAML and environment variables.
+    Files are read once per process and every call returns the same
+    read-only configuration, safe to share between threads without copying.
+    load_config.cache_clear() forces a re-read.
     
     Returns:
-        dict: Configuration dictionary
+        FrozenDict: Configuration; nested sections are FrozenDicts, lists are tuples
     """
+    return _read_config()
+
+
+def _freeze(value):
+    """Recursively copy dicts into FrozenDicts and lists into tuples"""
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@lru_cache(maxsize=1)
+def _read_config():
+    """Parse .env and settings.yaml into the configuration dictionary"""
     
     # Load environment variables
-    env_path = Path(__file__).parent.parent.parent / ".env"
+    env_path = PROJECT_ROOT / ".env"
     load_dotenv(env_path, override=False)
     
     # Load YAML config
-    config_path = Path(__file__).parent.parent.parent / "config" / "settings.yaml"
+    config_path = PROJECT_ROOT / "config" / "settings.yaml"
     
     with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=SafeLoader)
     
     # Override with environment variables while preserving YAML keys
     raw_gigachat_key = os.getenv('GIGACHAT_AUTH_KEY', '')
@@ -50,7 +96,11 @@ def load_config():
         'logs': Path(os.getenv('LOG_FOLDER', 'logs'))
     })
     
-    return config
+    # Environment overrides are applied above; nothing changes after this
+    return _freeze(config)
+
+
+load_config.cache_clear = _read_config.cache_clear
 
 
 if __name__ == "__main__":
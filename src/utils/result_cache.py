@@ -0,0 +1,78 @@
+"""
+Key/value cache for AI results
+Keeps results in memory and optionally persists them to SQLite across runs
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class ResultCache:
+    """Thread-safe cache of JSON-serializable results"""
+    
+    def __init__(self, db_path: Optional[Path] = None, table: str = "results"):
+        self.logger = logging.getLogger(__name__)
+        self.table = table
+        self._memory: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        
+        if db_path:
+            try:
+                db_path = Path(db_path)
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+                # WAL lets several caches (and processes) share the file without blocking readers
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Result cache disabled for {db_path}: {e}")
+                self._conn = None
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Return cached value or None"""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            
+            if self._conn is None:
+                return None
+            
+            try:
+                row = self._conn.execute(
+                    f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Result cache read failed: {e}")
+                return None
+            
+            if row is None:
+                return None
+            
+            value = json.loads(row[0])
+            self._memory[key] = value
+            return value
+    
+    def set(self, key: str, value: dict):
+        """Store value under key"""
+        with self._lock:
+            self._memory[key] = value
+            
+            if self._conn is None:
+                return
+            
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False))
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Result cache write failed: {e}")
@@ -0,0 +1,100 @@
+"""
+Similarity cache for AI results
+Returns a stored result when a new key text is a near-duplicate of a cached one
+"""
+
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _term_vector(text: str) -> Tuple[Dict[str, int], float]:
+    """Term-frequency vector of lowercased words and its Euclidean norm"""
+    counts = Counter(_WORD_RE.findall(text.lower()))
+    norm = math.sqrt(sum(count * count for count in counts.values()))
+    return counts, norm
+
+
+class SemanticCache:
+    """Thread-safe cache looked up by cosine similarity of word-frequency vectors"""
+
+    def __init__(self, db_path: Optional[Path] = None, threshold: float = 0.93, table: str = "semantic"):
+        self.logger = logging.getLogger(__name__)
+        self.threshold = threshold
+        self.table = table
+        # (vector, norm, value) per cached entry; term -> entry ids narrows the scan
+        self._entries: List[Tuple[Dict[str, int], float, dict]] = []
+        self._entries_by_term: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if db_path:
+            try:
+                db_path = Path(db_path)
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+                self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {self.table} (text TEXT NOT NULL, value TEXT NOT NULL)"
+                )
+                self._conn.commit()
+                for text, value in self._conn.execute(f"SELECT text, value FROM {self.table}"):
+                    self._add(text, json.loads(value))
+            except sqlite3.Error as e:
+                self.logger.warning(f"Semantic cache disabled for {db_path}: {e}")
+                self._conn = None
+
+    def get(self, text: str) -> Optional[dict]:
+        """Return the value of the most similar cached text at or above the threshold, or None"""
+        vector, norm = _term_vector(text)
+        if not norm:
+            return None
+
+        with self._lock:
+            candidates = {idx for term in vector for idx in self._entries_by_term.get(term, ())}
+            best_score, best_value = 0.0, None
+            for idx in candidates:
+                other, other_norm, value = self._entries[idx]
+                small, large = (vector, other) if len(vector) <= len(other) else (other, vector)
+                dot = sum(weight * large.get(term, 0) for term, weight in small.items())
+                score = dot / (norm * other_norm)
+                if score > best_score:
+                    best_score, best_value = score, value
+
+        return best_value if best_score >= self.threshold else None
+
+    def set(self, text: str, value: dict):
+        """Store value under text"""
+        with self._lock:
+            if not self._add(text, value) or self._conn is None:
+                return
+
+            try:
+                self._conn.execute(
+                    f"INSERT INTO {self.table} (text, value) VALUES (?, ?)",
+                    (text, json.dumps(value, ensure_ascii=False))
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self.logger.warning(f"Semantic cache write failed: {e}")
+
+    def _add(self, text: str, value: dict) -> bool:
+        """Index an entry in memory; False for texts without any words"""
+        vector, norm = _term_vector(text)
+        if not norm:
+            return False
+
+        idx = len(self._entries)
+        self._entries.append((vector, norm, value))
+        for term in vector:
+            self._entries_by_term.setdefault(term, []).append(idx)
+        return True
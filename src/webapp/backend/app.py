@@ -1,17 +1,33 @@
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from src.webapp.backend.job_manager import JobManager
+from src.utils.config_loader import load_config
+from src.webapp.backend.job_manager import JobManager, JobQueueFull, format_timestamp
 
 
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MAX_FILES_PER_JOB = 50
+MAX_FILE_SIZE = 100 << 20  # bytes per uploaded .msg file
+
 logger = logging.getLogger(__name__)
-app = FastAPI(title="ReportMaster API", version="1.0.1")
-job_manager = JobManager()
+job_manager = JobManager(load_config())
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Startup returns at once; pipeline imports finish in the background
+    job_manager.warm_up()
+    yield
+
+
+app = FastAPI(title="ReportMaster API", version="1.0.1", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,19 +48,31 @@ async def create_job(
     files: List[UploadFile] = File(...),
     report_month: Optional[str] = Form(default=None),
 ):
-    msg_files = [f for f in files if f.filename and f.filename.lower().endswith(".msg")]
-    if not msg_files:
-        raise HTTPException(status_code=400, detail="Upload at least one .msg file")
-    if len(msg_files) > 50:
-        raise HTTPException(status_code=400, detail="Maximum 50 files per run")
-
-    payloads = []
+    # Validate names, count and sizes in one pass before anything is copied
+    streams = []
     names = []
-    for file in msg_files:
-        payloads.append(await file.read())
+    for file in files:
+        if not file.filename or not file.filename.lower().endswith(".msg"):
+            continue
+        if len(names) == MAX_FILES_PER_JOB:
+            raise HTTPException(status_code=400, detail=f"Maximum {MAX_FILES_PER_JOB} files per run")
+        if file.size is not None and file.size > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{Path(file.filename).name} exceeds {MAX_FILE_SIZE // (1 << 20)} MB",
+            )
+        # Uploads are spooled to temporary files; they are copied to the job
+        # folder in chunks, off the event loop, instead of read into memory
+        streams.append(file.file)
         names.append(Path(file.filename).name)
 
-    job = job_manager.create_job(payloads, names, report_month=report_month)
+    if not names:
+        raise HTTPException(status_code=400, detail="Upload at least one .msg file")
+
+    try:
+        job = await run_in_threadpool(job_manager.create_job, streams, names, report_month=report_month)
+    except JobQueueFull:
+        raise HTTPException(status_code=429, detail="Server busy, try again later", headers={"Retry-After": "60"})
     return {"job_id": job.job_id, "status": job.status}
 
 
@@ -59,8 +87,8 @@ def get_job(job_id: str):
         "progress": job.progress,
         "step": job.step,
         "error": job.error,
-        "created_at": job.created_at,
-        "finished_at": job.finished_at,
+        "created_at": format_timestamp(job.created_at),
+        "finished_at": format_timestamp(job.finished_at),
         "stats": job.stats,
     }
 
@@ -68,18 +96,28 @@ def get_job(job_id: str):
 @app.get("/api/jobs/{job_id}/report")
 def download_report(job_id: str):
     report_path = job_manager.get_report_path(job_id)
-    if not report_path or not report_path.exists():
+    try:
+        # One stat both checks the file and gives FileResponse its size and mtime
+        stat_result = report_path.stat() if report_path else None
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None:
         raise HTTPException(status_code=404, detail="Report is not ready")
-    return FileResponse(path=report_path, filename=report_path.name)
+    return FileResponse(
+        path=report_path,
+        filename=report_path.name,
+        stat_result=stat_result,
+        media_type=DOCX_MEDIA_TYPE,
+    )
 
 
 @app.get("/api/jobs/{job_id}/attachments.zip")
 def download_attachments(job_id: str):
-    payload = job_manager.build_attachments_zip(job_id)
-    if payload is None:
+    chunks = job_manager.iter_attachments_zip(job_id)
+    if chunks is None:
         raise HTTPException(status_code=404, detail="Attachments are not ready")
-    return Response(
-        content=payload,
+    return StreamingResponse(
+        chunks,
         media_type="application/zip",
         headers={"Content-Disposition": f'attachment; filename="attachments_{job_id}.zip"'},
     )
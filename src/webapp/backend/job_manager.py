@@ -1,24 +1,87 @@
-import io
+import importlib
 import logging
+import os
+import shutil
 import threading
+import time
 import zipfile
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
 from uuid import uuid4
 
-from src.analyzers.categorizer import Categorizer
-from src.analyzers.summarizer import Summarizer
-from src.generators.attachment_manager import AttachmentManager
-from src.generators.word_generator import WordReportGenerator
-from src.parsers.msg_parser import MSGParser
-from src.parsers.thread_builder import ThreadBuilder
-from src.utils.api_client import ClaudeAPIClient
 from src.utils.config_loader import load_config
 
 
+# Chunk size for copying uploads into the job folder
+COPY_BUFFER_SIZE = 1 << 16
+
+# Attachments stored without compression in the downloadable archive
+STORED_SUFFIXES = frozenset({
+    ".zip", ".rar", ".7z", ".gz", ".docx", ".xlsx", ".pptx", ".pdf",
+    ".jpg", ".jpeg", ".png", ".gif", ".mp4", ".mov",
+})
+# Deflate level for other attachments: fast, most of the gain of the default level
+ZIP_DEFLATE_LEVEL = 1
+# A ZIP archive without entries: just the end-of-central-directory record
+EMPTY_ZIP = b"PK\x05\x06" + bytes(18)
+# Jobs accepted (running or waiting for a worker) before new ones are refused
+MAX_QUEUED_JOBS = 20
+
+
+class JobQueueFull(RuntimeError):
+    """Raised by create_job when MAX_QUEUED_JOBS jobs are already accepted"""
+
+
+class _ZipStreamBuffer:
+    """Write-only sink for ZipFile; the bytes written so far are taken with drain()"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+def format_timestamp(timestamp: Optional[float]) -> Optional[str]:
+    """Naive UTC ISO-8601 string for a Unix timestamp (None stays None)"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+# Modules _run_job imports; warm_up() loads them ahead of the first job
+_PIPELINE_MODULES = (
+    "src.analyzers.categorizer",
+    "src.analyzers.summarizer",
+    "src.generators.attachment_manager",
+    "src.generators.word_generator",
+    "src.parsers.msg_parser",
+    "src.parsers.thread_builder",
+    "src.utils.api_client",
+)
+
+
+def _import_pipeline():
+    """Load the modules _run_job imports (their import cost is paid ahead of time)"""
+    for name in _PIPELINE_MODULES:
+        importlib.import_module(name)
+
+
 @dataclass
 class JobState:
     job_id: str
@@ -26,11 +89,14 @@ class JobState:
     progress: int = 0
     step: str = "queued"
     error: Optional[str] = None
-    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
-    finished_at: Optional[str] = None
+    # Unix timestamps; format_timestamp() renders them for API responses
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
     report_path: Optional[str] = None
     attachments_path: Optional[str] = None
     stats: Dict = field(default_factory=dict)
+    # Guards updates of this job's fields; jobs do not contend with each other
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
 
 class JobManager:
@@ -39,34 +105,60 @@ class JobManager:
     Suitable for <=5 concurrent users and short-running tasks.
     """
 
-    def __init__(self):
+    def __init__(self, config: Optional[dict] = None):
         self.logger = logging.getLogger(__name__)
-        self.config = load_config()
+        self.config = config if config is not None else load_config()
+        # Per-job folders live under these
+        self.jobs_temp_dir = Path(self.config["paths"]["temp"]) / "jobs"
+        self.jobs_output_dir = Path(self.config["paths"]["output"]) / "jobs"
         self.jobs: Dict[str, JobState] = {}
         self.lock = threading.Lock()
         self.executor = ThreadPoolExecutor(max_workers=5)
+        # The executor queue is unbounded; a slot is held from create_job until _run_job ends
+        self._queue_slots = threading.BoundedSemaphore(MAX_QUEUED_JOBS)
+
+    def warm_up(self):
+        """Import the pipeline modules in the background so the first job does not wait for them"""
+        self.executor.submit(_import_pipeline)
 
-    def create_job(self, files: List[bytes], filenames: List[str], report_month: Optional[str] = None) -> JobState:
+    def create_job(self, files: List[Union[bytes, BinaryIO]], filenames: List[str], report_month: Optional[str] = None) -> JobState:
+        """
+        Store uploads (bytes or readable binary files, copied in chunks) and queue the job.
+        Raises JobQueueFull when the server already has MAX_QUEUED_JOBS jobs.
+        """
+        if not self._queue_slots.acquire(blocking=False):
+            raise JobQueueFull(f"{MAX_QUEUED_JOBS} jobs are already queued")
+        try:
+            return self._queue_job(files, filenames, report_month)
+        except BaseException:
+            self._queue_slots.release()
+            raise
+
+    def _queue_job(self, files: List[Union[bytes, BinaryIO]], filenames: List[str], report_month: Optional[str]) -> JobState:
         job_id = uuid4().hex
         job = JobState(job_id=job_id)
         with self.lock:
             self.jobs[job_id] = job
 
-        input_dir = Path(self.config["paths"]["temp"]) / "jobs" / job_id / "input"
+        input_dir = self.jobs_temp_dir / job_id / "input"
         input_dir.mkdir(parents=True, exist_ok=True)
 
         for data, filename in zip(files, filenames):
             safe_name = Path(filename).name
             if not safe_name.lower().endswith(".msg"):
                 continue
-            (input_dir / safe_name).write_bytes(data)
+            if isinstance(data, (bytes, bytearray)):
+                (input_dir / safe_name).write_bytes(data)
+            else:
+                with open(input_dir / safe_name, "wb") as dst:
+                    shutil.copyfileobj(data, dst, COPY_BUFFER_SIZE)
 
         self.executor.submit(self._run_job, job_id, report_month)
         return job
 
     def get_job(self, job_id: str) -> Optional[JobState]:
-        with self.lock:
-            return self.jobs.get(job_id)
+        # A single dict lookup is atomic; self.lock only serializes adding jobs
+        return self.jobs.get(job_id)
 
     def get_report_path(self, job_id: str) -> Optional[Path]:
         job = self.get_job(job_id)
@@ -74,42 +166,77 @@ class JobManager:
             return None
         return Path(job.report_path)
 
-    def build_attachments_zip(self, job_id: str) -> Optional[bytes]:
+    def iter_attachments_zip(self, job_id: str) -> Optional[Iterator[bytes]]:
+        """
+        ZIP archive of the job's attachments as a stream of chunks, built while
+        it is sent, or None when attachments are not ready
+        """
         job = self.get_job(job_id)
         if not job or not job.attachments_path:
             return None
 
         attachments_dir = Path(job.attachments_path)
-        if not attachments_dir.exists():
+        try:
+            with os.scandir(attachments_dir) as entries:
+                is_empty = next(entries, None) is None
+        except FileNotFoundError:
             return None
 
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for path in attachments_dir.rglob("*"):
-                if path.is_file():
-                    zf.write(path, arcname=str(path.relative_to(attachments_dir)))
-        return buffer.getvalue()
+        # Summary-only jobs: the empty archive is a constant, no zip writer needed
+        if is_empty:
+            return iter((EMPTY_ZIP,))
+        return self._zip_chunks(attachments_dir)
+
+    def _zip_chunks(self, attachments_dir: Path) -> Iterator[bytes]:
+        buffer = _ZipStreamBuffer()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=ZIP_DEFLATE_LEVEL) as zf:
+            # os.walk classifies entries from the directory listing itself
+            for dirpath, _, filenames in os.walk(attachments_dir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    # Already-compressed formats gain nothing from another deflate pass
+                    stored = os.path.splitext(filename)[1].lower() in STORED_SUFFIXES
+                    zf.write(
+                        path,
+                        arcname=os.path.relpath(path, attachments_dir),
+                        compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED,
+                    )
+                    # Each entry is sent as soon as it is written
+                    yield buffer.drain()
+        # Central directory, written when the archive closes
+        if buffer.size:
+            yield buffer.drain()
 
     def _set_progress(self, job_id: str, step: str, progress: int, status: str = "processing", error: Optional[str] = None):
-        with self.lock:
-            job = self.jobs[job_id]
+        job = self.jobs[job_id]
+        with job.lock:
             job.step = step
             job.progress = progress
             job.status = status
             job.error = error
             if status in {"completed", "failed"}:
-                job.finished_at = datetime.utcnow().isoformat()
+                job.finished_at = time.time()
 
     def _run_job(self, job_id: str, report_month: Optional[str]):
         self._set_progress(job_id, "initializing", 1, "processing")
         try:
+            # Pipeline modules (python-docx, httpx, ...) are not imported at server
+            # start; warm_up() usually has them loaded by the first job
+            from src.analyzers.categorizer import Categorizer
+            from src.analyzers.summarizer import Summarizer
+            from src.generators.attachment_manager import AttachmentManager
+            from src.generators.word_generator import WordReportGenerator
+            from src.parsers.msg_parser import MSGParser
+            from src.parsers.thread_builder import ThreadBuilder
+            from src.utils.api_client import ClaudeAPIClient
+
             config = self.config
-            input_dir = Path(config["paths"]["temp"]) / "jobs" / job_id / "input"
+            input_dir = self.jobs_temp_dir / job_id / "input"
             files = list(input_dir.glob("*.msg"))
             if not files:
                 raise RuntimeError("No .msg files uploaded")
 
-            parser = MSGParser()
+            parser = MSGParser(max_workers=config.get("email", {}).get("parsing", {}).get("workers", 1))
             thread_builder = ThreadBuilder(config)
             api_client = ClaudeAPIClient(config)
             categorizer = Categorizer(config, api_client)
@@ -118,31 +245,47 @@ class JobManager:
             attachment_manager = AttachmentManager(config)
 
             self._set_progress(job_id, "parsing", 10)
-            messages = parser.parse_files(files)
+            messages = parser.parse_files(
+                files,
+                progress_callback=lambda done, total: self._set_progress(job_id, "parsing", 10 + 20 * done // total),
+            )
 
             self._set_progress(job_id, "threading", 30)
             threads = thread_builder.build_threads(messages)
 
             self._set_progress(job_id, "categorization", 50)
-            categories = categorizer.categorize_threads(threads)
-
-            self._set_progress(job_id, "summarization", 70)
-            summaries = summarizer.summarize_categories(categories)
+            categories = categorizer.categorize_threads(
+                threads,
+                progress_callback=lambda done, total: self._set_progress(job_id, "categorization", 50 + 20 * done // total),
+            )
 
-            output_dir = Path(config["paths"]["output"]) / "jobs" / job_id
+            output_dir = self.jobs_output_dir / job_id
             output_dir.mkdir(parents=True, exist_ok=True)
             report_filename = f"Monthly_Report_{datetime.now().strftime('%Y_%m_%d_%H%M')}.docx"
             report_path = output_dir / report_filename
 
-            self._set_progress(job_id, "report_generation", 85)
-            word_generator.generate_report(
-                summaries=summaries,
-                output_path=report_path,
-                report_month=report_month or datetime.now().strftime("%B %Y"),
-            )
+            # Attachments only depend on the categories: write them to disk
+            # while summarization waits on the API
+            with ThreadPoolExecutor(max_workers=1) as attachment_executor:
+                attachments_future = attachment_executor.submit(
+                    attachment_manager.save_attachments, categories, output_dir
+                )
+
+                self._set_progress(job_id, "summarization", 70)
+                summaries = summarizer.summarize_categories(
+                    categories,
+                    progress_callback=lambda done, total: self._set_progress(job_id, "summarization", 70 + 15 * done // total),
+                )
 
-            self._set_progress(job_id, "attachments", 95)
-            att_stats = attachment_manager.save_attachments(categories, output_dir)
+                self._set_progress(job_id, "report_generation", 85)
+                word_generator.generate_report(
+                    summaries=summaries,
+                    output_path=report_path,
+                    report_month=report_month or datetime.now().strftime("%B %Y"),
+                )
+
+                self._set_progress(job_id, "attachments", 95)
+                att_stats = attachments_future.result()
 
             stats = {
                 "total_messages": len(messages),
@@ -160,8 +303,8 @@ class JobManager:
                 }
             )
 
-            with self.lock:
-                job = self.jobs[job_id]
+            job = self.jobs[job_id]
+            with job.lock:
                 job.report_path = str(report_path)
                 job.attachments_path = str(output_dir / "Attachments")
                 job.stats = stats
@@ -171,3 +314,5 @@ class JobManager:
         except Exception as exc:
             self.logger.exception("Job %s failed", job_id)
             self._set_progress(job_id, "failed", 100, status="failed", error=str(exc))
+        finally:
+            self._queue_slots.release()
@@ -1,20 +1,45 @@
+import io
+import json
+import pickle
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from types import SimpleNamespace
 
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
 from src.analyzers.categorizer import Categorizer
 from src.analyzers.categorizer import ThreadCategory
+from src.analyzers.summarizer import Summarizer
 from src.generators.attachment_manager import AttachmentManager
+from src.generators.word_generator import WordReportGenerator
+from src.parsers.content_cleaner import ContentCleaner
+from src.parsers.msg_parser import MSGParser
 from src.parsers.thread_builder import ThreadBuilder
+from src.utils.api_client import GigaChatAPIClient, _json_complete, _shared_http_client
+from src.utils.config_loader import load_config
+from src.utils.semantic_cache import SemanticCache
+from src.webapp.backend import app as webapp
+from src.webapp.backend import job_manager as job_manager_module
 
 
 class DummyAPIClient:
     def __init__(self):
         self.client = object()
+        self.model_categorization = "test-model"
 
     def categorize_thread(self, subject, keywords, sample_content):
         return {"category": "Общая категория", "description": "test"}
 
+    def categorize_threads_batch(self, subjects, keywords_list, samples_list):
+        return [self.categorize_thread(*args) for args in zip(subjects, keywords_list, samples_list)]
+
 
 def _make_thread(subject: str, body: str = "Body text"):
     msg = SimpleNamespace(
@@ -26,6 +51,16 @@ def _make_thread(subject: str, body: str = "Body text"):
     return SimpleNamespace(subject=subject, messages=[msg], message_count=1)
 
 
+def _mock_api_client(handler, **api_settings):
+    """GigaChat client whose HTTP requests go to handler, with a valid token and no response cache"""
+    config = {"api": {"gigachat_auth_key": "key", "response_cache": {"enabled": False}, **api_settings}}
+    client = GigaChatAPIClient(config)
+    client.http = httpx.Client(transport=httpx.MockTransport(handler))
+    client._access_token = "token"
+    client._token_expires_at = int(time.time()) + 3600
+    return client
+
+
 def test_categorizer_merges_same_category_names():
     config = {"categorization": {"ai_labeling": {"enabled": True}}}
     categorizer = Categorizer(config, DummyAPIClient())
@@ -37,6 +72,364 @@ def test_categorizer_merges_same_category_names():
     assert categories[0].thread_count == 2
 
 
+def test_categorizer_merges_names_differing_in_word_ending():
+    names = iter(["Вопросы по инвойсу", "Проект А", "Вопросы по инвойсам", "Проект Б"])
+    api_client = DummyAPIClient()
+    api_client.categorize_thread = lambda *args: {"category": next(names), "description": "test"}
+    categorizer = Categorizer({}, api_client)
+    threads = [_make_thread(f"Thread {idx}", f"Body {idx}") for idx in range(4)]
+
+    categories = categorizer.categorize_threads(threads)
+
+    assert [(c.name, c.thread_count) for c in categories] == [
+        ("Вопросы по инвойсу", 2),
+        ("Проект А", 1),
+        ("Проект Б", 1),
+    ]
+
+
+def test_categorizer_ending_merge_ignores_unrelated_names_and_derived_words():
+    names = iter([
+        "Вопросы по инвойсам",
+        "Вопросы по инвойсам и актам",
+        "Вопросы по инвойсу",
+        "Согласование планировки",
+        "Согласование планирования",
+    ])
+    api_client = DummyAPIClient()
+    api_client.categorize_thread = lambda *args: {"category": next(names), "description": "test"}
+    categorizer = Categorizer({}, api_client)
+    threads = [_make_thread(f"Thread {idx}", f"Body {idx}") for idx in range(5)]
+
+    categories = categorizer.categorize_threads(threads)
+
+    assert [(c.name, c.thread_count) for c in categories] == [
+        ("Вопросы по инвойсам", 2),
+        ("Вопросы по инвойсам и актам", 1),
+        ("Согласование планировки", 1),
+        ("Согласование планирования", 1),
+    ]
+
+
+def test_categorizer_reuses_cached_categories():
+    api_client = DummyAPIClient()
+    calls = []
+    original_batch = api_client.categorize_threads_batch
+    api_client.categorize_threads_batch = lambda *args: calls.append(args) or original_batch(*args)
+    categorizer = Categorizer({}, api_client)
+
+    categorizer.categorize_threads([_make_thread("One")])
+    categories = categorizer.categorize_threads([_make_thread("One")])
+
+    assert len(calls) == 1
+    assert categories[0].name == "Общая категория"
+
+
+def test_categorizer_cache_expires_and_is_keyed_by_model(monkeypatch, tmp_path: Path):
+    config = {"categorization": {"cache": {"ttl_hours": 1}}, "paths": {"temp": tmp_path}}
+    api_client = DummyAPIClient()
+    calls = []
+    original_batch = api_client.categorize_threads_batch
+    api_client.categorize_threads_batch = lambda *args: calls.append(args) or original_batch(*args)
+
+    Categorizer(config, api_client).categorize_threads([_make_thread("One")])
+    Categorizer(config, api_client).categorize_threads([_make_thread("One")])
+    assert len(calls) == 1
+
+    api_client.model_categorization = "other-model"
+    Categorizer(config, api_client).categorize_threads([_make_thread("One")])
+    assert len(calls) == 2
+
+    two_hours_later = time.time() + 7200
+    monkeypatch.setattr("src.analyzers.categorizer.time.time", lambda: two_hours_later)
+    Categorizer(config, api_client).categorize_threads([_make_thread("One")])
+    assert len(calls) == 3
+
+
+def test_categorizer_sends_duplicate_threads_once():
+    api_client = DummyAPIClient()
+    calls = []
+    original_batch = api_client.categorize_threads_batch
+    api_client.categorize_threads_batch = lambda *args: calls.append(args) or original_batch(*args)
+    categorizer = Categorizer({}, api_client)
+
+    categories = categorizer.categorize_threads([_make_thread("Notice"), _make_thread("Notice"), _make_thread("Other")])
+
+    assert [subjects for subjects, _, _ in calls] == [["Notice", "Other"]]
+    assert sum(c.thread_count for c in categories) == 3
+
+
+def test_batch_categorization_falls_back_for_missing_items(monkeypatch):
+    client = GigaChatAPIClient({"api": {"gigachat_auth_key": "key"}})
+    prompts = []
+
+    def fake_completion(prompt, model, max_tokens, system=None):
+        prompts.append(prompt)
+        if len(prompts) == 1:
+            return '[{"i": 1, "category": "Согласование ТЗ", "description": "d1"}]'
+        return "Категория: Договор\nОписание: d2"
+
+    monkeypatch.setattr(client, "_chat_completion", fake_completion)
+
+    results = client.categorize_threads_batch(["A", "B"], [["x"], ["y"]], ["a", "b"])
+
+    assert results == [
+        {"category": "Согласование ТЗ", "description": "d1"},
+        {"category": "Договор", "description": "d2"},
+    ]
+    assert len(prompts) == 2
+
+
+def test_completion_cache_reuses_identical_requests_across_clients(monkeypatch, tmp_path: Path):
+    config = {"api": {"gigachat_auth_key": "key"}, "paths": {"temp": tmp_path}}
+    prompts = []
+
+    def fake_completion(prompt, model, max_tokens, system=None):
+        prompts.append(prompt)
+        return "Категория: Договор\nОписание: d"
+
+    for _ in range(2):
+        client = GigaChatAPIClient(config)
+        monkeypatch.setattr(client, "_chat_completion", fake_completion)
+        assert client.categorize_thread("Тема", ["x"], "текст") == {"category": "Договор", "description": "d"}
+
+    assert len(prompts) == 1
+
+
+def test_completion_cache_skips_unparseable_answers(monkeypatch, tmp_path: Path):
+    config = {"api": {"gigachat_auth_key": "key"}, "paths": {"temp": tmp_path}}
+    answers = iter(['{"context": "обрыв', '{"context": "ok"}', "Не знаю", "Категория: Договор\nОписание: d"])
+    prompts = []
+
+    def fake_completion(prompt, model, max_tokens, system=None):
+        prompts.append(prompt)
+        return next(answers)
+
+    results = []
+    for _ in range(3):
+        client = GigaChatAPIClient(config)
+        monkeypatch.setattr(client, "_chat_completion", fake_completion)
+        results.append(client.summarize_thread(["Текст"], [], "март", "Договор", "ctx")["context"])
+    assert results == ["ctx", "ok", "ok"]
+
+    categories = []
+    for _ in range(3):
+        client = GigaChatAPIClient(config)
+        monkeypatch.setattr(client, "_chat_completion", fake_completion)
+        categories.append(client.categorize_thread("Тема", ["x"], "текст")["category"])
+    assert categories == ["Без категории", "Договор", "Договор"]
+
+    assert len(prompts) == 4
+
+
+def test_api_clients_share_one_in_flight_limit():
+    config = {"api": {"gigachat_auth_key": "key", "max_concurrency": 3, "response_cache": {"enabled": False}}}
+    first, second = GigaChatAPIClient(config), GigaChatAPIClient(config)
+
+    assert first.http is second.http
+    for _ in range(3):
+        assert first._request_slots.acquire(blocking=False)
+    # A second job's client waits for the first one's requests
+    assert not second._request_slots.acquire(blocking=False)
+    for _ in range(3):
+        first._request_slots.release()
+
+
+def test_shared_http_client_is_replaced_with_its_request_limit_kept():
+    client, request_slots = _shared_http_client(verify_ssl=True, http2=False, max_concurrency=5)
+    assert _shared_http_client(verify_ssl=True, http2=False, max_concurrency=5) == (client, request_slots)
+
+    client.close()
+    new_client, new_slots = _shared_http_client(verify_ssl=True, http2=False, max_concurrency=5)
+
+    assert new_client is not client and not new_client.is_closed
+    assert new_slots is request_slots
+
+
+def test_completion_retries_rate_limits_and_server_errors(monkeypatch):
+    statuses = iter([503, 429, 200])
+    delays = []
+    monkeypatch.setattr("src.utils.api_client.time.sleep", delays.append)
+
+    def handler(request):
+        status = next(statuses)
+        if status == 429:
+            return httpx.Response(429, headers={"Retry-After": "2"})
+        if status != 200:
+            return httpx.Response(status)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    client = _mock_api_client(handler)
+
+    assert client._cached_completion("p", "m", 10) == "ok"
+    assert len(delays) == 2
+    assert 1.0 <= delays[0] <= 1.5
+    assert delays[1] == 2.0
+
+
+def test_completion_raises_client_errors_and_exhausted_retries(monkeypatch):
+    monkeypatch.setattr("src.utils.api_client.time.sleep", lambda delay: None)
+    calls = []
+
+    def bad_request(request):
+        calls.append(request)
+        return httpx.Response(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        _mock_api_client(bad_request)._cached_completion("p", "m", 10)
+    assert len(calls) == 1
+
+    def unreachable(request):
+        calls.append(request)
+        raise httpx.ConnectError("refused", request=request)
+
+    calls.clear()
+    with pytest.raises(httpx.ConnectError):
+        _mock_api_client(unreachable, max_retries=2)._cached_completion("p", "m", 10)
+    assert len(calls) == 3
+
+
+def test_failed_batch_categorization_falls_back_without_per_thread_requests(monkeypatch):
+    monkeypatch.setattr("src.utils.api_client.time.sleep", lambda delay: None)
+    calls = []
+
+    def unavailable(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    client = _mock_api_client(unavailable, max_retries=1)
+
+    results = client.categorize_threads_batch(["Тема 1", "Тема 2", "Тема 3"], [[], [], []], ["a", "b", "c"])
+
+    assert [result["category"] for result in results] == ["Тема 1", "Тема 2", "Тема 3"]
+    assert all(result["fallback"] for result in results)
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("content, opener, complete", [
+    ('{"a": "}"}', "{", True),
+    ('{"a": "}"', "{", False),
+    ('{"a": "\\"}', "{", False),
+    ('{"a": "\\"}"}', "{", True),
+    ('{"a": {"b": [1, "]"]}}', "{", True),
+    ('{"a": {"b": [1, 2]}', "{", False),
+    ('Ответ: {oops} {"a": 1} и пояснение', "{", True),
+    ('[{"i": 1}, {"i": 2}]', "[", True),
+    ('[{"i": 1}, {"i": 2}', "[", False),
+    ("", "{", False),
+])
+def test_json_complete_tracks_strings_escapes_and_nesting(content, opener, complete):
+    assert _json_complete(content, opener) is complete
+
+
+def test_streamed_json_completion_stops_after_the_value(monkeypatch):
+    events = ['{"context": "a}', '", "actions": ["1. [x]"]', '}', " Пояснение после JSON", "[DONE]"]
+    sent = []
+
+    def stream():
+        for event in events:
+            sent.append(event)
+            data = event if event == "[DONE]" else json.dumps({"choices": [{"delta": {"content": event}}]})
+            yield f"data: {data}\n\n".encode("utf-8")
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=stream())
+
+    client = _mock_api_client(handler, stream_json=True)
+
+    content = client._cached_completion("p", "m", 100, json_opener="{")
+
+    assert content == '{"context": "a}", "actions": ["1. [x]"]}'
+    assert sent == events[:3]
+    # The final chunk, which carries usage, is never read: lengths give an estimate
+    assert client.get_usage_stats() == {"prompt_tokens": 1, "completion_tokens": 10, "total_tokens": 11}
+
+
+def test_streamed_completion_read_to_the_end_reports_provider_usage():
+    body = (
+        'data: {"choices": [{"delta": {"content": "Без JSON"}}]}\n\n'
+        'data: {"choices": [], "usage": {"prompt_tokens": 40, "completion_tokens": 60, "total_tokens": 100}}\n\n'
+        "data: [DONE]\n\n"
+    )
+    client = _mock_api_client(
+        lambda request: httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=body.encode("utf-8")),
+        stream_json=True,
+    )
+
+    assert client._cached_completion("p", "m", 100, json_opener="{") == "Без JSON"
+    assert client.get_usage_stats() == {"prompt_tokens": 40, "completion_tokens": 60, "total_tokens": 100}
+
+
+def _token_cache_client(token_path: Path, oauth_calls: list):
+    """Client without an in-memory token that caches it in token_path; OAuth requests are recorded"""
+    def handler(request):
+        oauth_calls.append(request)
+        return httpx.Response(200, json={"access_token": "fresh", "expires_at": (int(time.time()) + 1800) * 1000})
+
+    client = _mock_api_client(handler)
+    client._access_token = None
+    client._token_expires_at = 0
+    client.token_cache_path = token_path
+    return client
+
+
+def test_token_file_cache_is_reused_until_it_expires(tmp_path: Path):
+    token_path = tmp_path / "token.json"
+    oauth_calls = []
+    token_path.write_text(json.dumps({"token": "cached", "expires_at": int(time.time()) + 3600}))
+
+    assert _token_cache_client(token_path, oauth_calls)._get_access_token() == "cached"
+    assert oauth_calls == []
+
+    token_path.write_text(json.dumps({"token": "cached", "expires_at": int(time.time()) + 30}))
+
+    assert _token_cache_client(token_path, oauth_calls)._get_access_token() == "fresh"
+    assert len(oauth_calls) == 1
+    assert json.loads(token_path.read_text())["token"] == "fresh"
+    assert token_path.stat().st_mode & 0o777 == 0o600
+
+    # Another client (or process) picks up the refreshed token from the file
+    assert _token_cache_client(token_path, oauth_calls)._get_access_token() == "fresh"
+    assert len(oauth_calls) == 1
+
+
+def test_token_file_cache_replaces_a_corrupt_file(tmp_path: Path):
+    token_path = tmp_path / "token.json"
+    oauth_calls = []
+    token_path.write_text("{not json")
+
+    assert _token_cache_client(token_path, oauth_calls)._get_access_token() == "fresh"
+    assert len(oauth_calls) == 1
+    assert json.loads(token_path.read_text())["token"] == "fresh"
+
+
+def test_semantic_cache_matches_near_duplicates_after_reload(tmp_path: Path):
+    db_path = tmp_path / "cache.sqlite"
+    SemanticCache(db_path, threshold=0.9).set("Согласование ТЗ гостиницы, период 01.02.2024", {"result": "ok"})
+
+    cache = SemanticCache(db_path, threshold=0.9)
+    assert cache.get("согласование ТЗ гостиницы — период 01.02.2024") == {"result": "ok"}
+    assert cache.get("Договор подряда") is None
+
+
+def test_loaded_config_is_read_only_and_picklable():
+    config = load_config()
+
+    assert load_config() is config
+    with pytest.raises(TypeError):
+        config["api"] = {}
+    with pytest.raises(TypeError):
+        config["api"]["max_tokens"] = 1
+    with pytest.raises(TypeError):
+        config["paths"].update(temp="elsewhere")
+
+    restored = pickle.loads(pickle.dumps(config))
+    assert restored == config
+    with pytest.raises(TypeError):
+        restored["api"]["max_tokens"] = 1
+
+
 def test_attachment_manager_sanitizes_filename(tmp_path: Path):
     manager = AttachmentManager({})
     category_dir = tmp_path / "Attachments" / "001_test"
@@ -69,6 +462,34 @@ def test_thread_builder_splits_same_subject_with_low_participant_overlap():
     assert len(threads) == 2
 
 
+def test_thread_builder_groups_stacked_reply_prefixes():
+    builder = ThreadBuilder({})
+
+    now = datetime.now()
+    messages = [
+        SimpleNamespace(subject=subject, sender="a@x.com", recipients=["b@x.com"], cc=[], date=now, has_attachments=False, attachment_count=0)
+        for subject in ("Смета", "RE: Смета", "Re: FW: [EXT] Смета")
+    ]
+
+    threads = builder.build_threads(messages)
+    assert [t.message_count for t in threads] == [3]
+
+
+def test_thread_builder_merges_near_duplicate_subjects():
+    builder = ThreadBuilder({"email": {"thread_grouping": {"subject_similarity": 0.6}}})
+
+    now = datetime.now()
+    messages = [
+        SimpleNamespace(subject=subject, sender="a@x.com", recipients=["b@x.com"], cc=[], date=now, has_attachments=False, attachment_count=0)
+        for subject in ("Quarterly budget report", "RE: Quarterly budget report v2", "Office party")
+    ]
+
+    threads = builder.build_threads(messages)
+    assert sorted(t.message_count for t in threads) == [1, 2]
+    # Off unless configured: exact subject matching keeps the groups apart
+    assert len(ThreadBuilder({}).build_threads(messages)) == 3
+
+
 def test_attachment_folder_name_matches_report_section_format(tmp_path: Path):
     manager = AttachmentManager({})
     category = ThreadCategory("CAT_001", "Согласование ТЗ")
@@ -86,3 +507,185 @@ def test_attachment_folder_name_matches_report_section_format(tmp_path: Path):
     assert folder.exists()
     assert (folder / "spec.pdf").exists()
     assert stats["total_attachments"] == 1
+
+
+def test_attachment_manager_links_identical_payloads(tmp_path: Path):
+    manager = AttachmentManager({})
+    category = ThreadCategory("CAT_001", "Договор")
+
+    msg = SimpleNamespace(
+        has_attachments=True,
+        attachments=[
+            {"filename": "contract.pdf", "data": b"same-bytes"},
+            {"filename": "contract.pdf", "data": b"same-bytes"},
+            {"filename": "other.pdf", "data": b"other-bytes"},
+        ],
+    )
+    category.add_thread(SimpleNamespace(messages=[msg], total_attachments=3))
+
+    stats = manager.save_attachments([category], tmp_path)
+
+    folder = tmp_path / "Attachments" / "4.1_Договор"
+    assert (folder / "contract_1.pdf").read_bytes() == b"same-bytes"
+    assert (folder / "other.pdf").read_bytes() == b"other-bytes"
+    assert stats["total_attachments"] == 3
+    assert stats["deduplicated_attachments"] == 1
+
+
+def test_attachment_manager_streams_file_object_payloads(tmp_path: Path):
+    manager = AttachmentManager({})
+    category = ThreadCategory("CAT_001", "Отчеты")
+
+    msg = SimpleNamespace(
+        has_attachments=True,
+        attachments=[{"filename": "report.pdf", "data": io.BytesIO(b"streamed-bytes")}],
+    )
+    category.add_thread(SimpleNamespace(messages=[msg], total_attachments=1))
+
+    stats = manager.save_attachments([category], tmp_path)
+
+    assert (tmp_path / "Attachments" / "4.1_Отчеты" / "report.pdf").read_bytes() == b"streamed-bytes"
+    assert stats["total_attachments"] == 1
+
+
+def test_word_report_table_rows(tmp_path: Path):
+    from docx import Document
+
+    summaries = {
+        "CAT_001": {
+            "actions": ["1. Направлено ТЗ.", "2. Получены замечания."],
+            "result": "Согласовано",
+            "date_range": "01.02.2024–05.02.2024",
+            "message_count": 3,
+            "attachment_count": 1,
+        }
+    }
+    report_path = WordReportGenerator({}).generate_report(summaries, tmp_path / "report.docx", "Февраль 2024")
+
+    rows = Document(str(report_path)).tables[0].rows
+    assert [cell.text for cell in rows[1].cells] == [
+        "4.1",
+        "1. Направлено ТЗ. 2. Получены замечания.\n\nРезультат работ: Согласовано",
+        "01.02.2024–05.02.2024",
+    ]
+    assert rows[0].cells[0].paragraphs[0].style.name == "ReportCellHeader"
+    assert rows[1].cells[1].paragraphs[0].style.name == "ReportCell"
+
+
+def test_content_cleaner_strips_markup_disclaimers_signatures_and_quotes():
+    cleaner = ContentCleaner()
+    text = (
+        "<p>Добрый&nbsp;день,</p>   коллеги\n\n\n\nСогласуйте ТЗ &amp; смету.\n"
+        "> старая цитата\n"
+        "This email and attachments are confidential\n"
+        "--\n"
+        "Иван"
+    )
+
+    assert cleaner.clean(text) == "Добрый день, коллеги\n\nСогласуйте ТЗ & смету."
+    assert cleaner.extract_main_content("Ответ\nOn Mon, Ivan wrote:\nстарое") == "Ответ"
+
+
+def test_msg_parser_skips_unreadable_files_in_worker_processes(tmp_path: Path):
+    msg_files = []
+    for idx in range(MSGParser.PARALLEL_MIN_FILES):
+        msg_file = tmp_path / f"broken_{idx}.msg"
+        msg_file.write_bytes(b"not an outlook message")
+        msg_files.append(msg_file)
+
+    assert MSGParser(max_workers=2).parse_files(msg_files) == []
+
+
+def test_msg_parser_lists_msg_files_in_any_case(tmp_path: Path):
+    for name in ("a.msg", "B.MSG", "c.Msg", ".hidden.msg", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "folder.msg").mkdir()
+
+    names = sorted(path.name for path in MSGParser()._iter_msg_files(tmp_path))
+
+    assert names == ["B.MSG", "a.msg", "c.Msg"]
+
+
+def test_summarizer_fallback_collects_dates_and_participants():
+    category = ThreadCategory("CAT_001", "Согласование ТЗ", "Обсуждение ТЗ")
+    messages = [
+        SimpleNamespace(body="Первое письмо", sender="a@x.ru", recipients=["b@x.ru"],
+                        date=datetime(2024, 2, 5), attachments=[]),
+        SimpleNamespace(body="Второе письмо", sender="b@x.ru", recipients=["a@x.ru", "c@x.ru"],
+                        date=datetime(2024, 2, 1), attachments=[]),
+    ]
+    category.add_thread(SimpleNamespace(messages=messages, message_count=2, total_attachments=0))
+
+    summary = Summarizer({}, SimpleNamespace(client=None)).summarize_categories([category])["CAT_001"]
+
+    assert summary["date_range"] == "01.02.2024–05.02.2024"
+    assert sorted(summary["participants"]) == ["a@x.ru", "b@x.ru", "c@x.ru"]
+    assert summary["message_count"] == 2
+
+
+def test_job_queue_answers_429_past_the_cap_until_a_job_ends(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(job_manager_module, "MAX_QUEUED_JOBS", 1)
+    manager = job_manager_module.JobManager({"paths": {"temp": tmp_path / "temp", "output": tmp_path / "output"}})
+    manager.executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(webapp, "job_manager", manager)
+    # The first job fails while parsing, the second completes with an empty report
+    outcomes = iter([RuntimeError("broken upload"), [], []])
+
+    def parse_files(self, msg_files, progress_callback=None):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(MSGParser, "parse_files", parse_files)
+    api = TestClient(webapp.app)
+    upload = [("files", ("letter.msg", b"msg", "application/octet-stream"))]
+
+    def wait_for_worker():
+        # Single worker: a no-op submitted now runs after the queued job has fully ended
+        manager.executor.submit(lambda: None).result(timeout=30)
+
+    gate = threading.Event()
+    manager.executor.submit(gate.wait)
+    first = api.post("/api/jobs", files=upload)
+    assert first.status_code == 200
+    busy = api.post("/api/jobs", files=upload)
+    assert busy.status_code == 429
+    assert busy.headers["Retry-After"] == "60"
+
+    gate.set()
+    wait_for_worker()
+    assert manager.get_job(first.json()["job_id"]).status == "failed"
+
+    second = api.post("/api/jobs", files=upload)
+    assert second.status_code == 200
+    wait_for_worker()
+    assert manager.get_job(second.json()["job_id"]).status == "completed"
+    assert api.post("/api/jobs", files=upload).status_code == 200
+    wait_for_worker()
+    manager.executor.shutdown()
+
+
+def test_attachments_zip_streams_a_readable_archive(tmp_path: Path):
+    manager = job_manager_module.JobManager({"paths": {"temp": tmp_path / "temp", "output": tmp_path / "output"}})
+    attachments_dir = tmp_path / "Attachments"
+    (attachments_dir / "001_Договор").mkdir(parents=True)
+    (attachments_dir / "001_Договор" / "смета.txt").write_text("строка\n" * 1000, encoding="utf-8")
+    (attachments_dir / "001_Договор" / "scan.JPG").write_bytes(bytes(range(256)) * 8)
+    (attachments_dir / "notes.csv").write_bytes(b"a,b\n")
+    job = job_manager_module.JobState(job_id="job", attachments_path=str(attachments_dir))
+    manager.jobs["job"] = job
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(manager.iter_attachments_zip("job"))))
+
+    assert archive.testzip() is None
+    entries = {info.filename: info for info in archive.infolist()}
+    assert sorted(entries) == ["001_Договор/scan.JPG", "001_Договор/смета.txt", "notes.csv"]
+    assert archive.read("001_Договор/смета.txt").decode("utf-8") == "строка\n" * 1000
+    assert entries["001_Договор/scan.JPG"].compress_type == zipfile.ZIP_STORED
+    assert entries["001_Договор/смета.txt"].compress_type == zipfile.ZIP_DEFLATED
+
+    # Summary-only jobs leave an empty folder: still a valid (empty) archive
+    shutil.rmtree(attachments_dir)
+    attachments_dir.mkdir()
+    assert zipfile.ZipFile(io.BytesIO(b"".join(manager.iter_attachments_zip("job")))).namelist() == []